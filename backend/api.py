@@ -0,0 +1,564 @@
+"""
+Request handling for the SPARD API, shared by the Flask (app.py) and asyncio (asgi.py) servers
+Builds the conflict checker, database and history writer once per process, and holds every
+route's logic as a plain function of the parsed request that returns an ApiResponse. The
+servers only parse requests, route them and turn ApiResponses into their own responses.
+Handlers block on the database; asgi.py runs them on its thread executors.
+"""
+
+import atexit
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from conflict_checker import ConflictChecker, parse_prescription
+from knowledge_base import DEFAULT_KNOWLEDGE_BASE_PATH
+from database import DatabaseManager, AnalysisHistoryWriter, PasswordHasher
+from logging_config import setup_logging
+from records import json_default
+from static_responses import StaticResponses
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Knowledge base data file; edits are hot-reloaded (polled every N seconds, 0 = off, or on SIGHUP)
+KNOWLEDGE_BASE_PATH = os.environ.get("SPARD_KNOWLEDGE_BASE", DEFAULT_KNOWLEDGE_BASE_PATH)
+KNOWLEDGE_BASE_POLL_SECONDS = float(os.environ.get("SPARD_KNOWLEDGE_BASE_POLL", "5"))
+# bcrypt cost for new hashes (existing ones are upgraded on login) and threads allowed to run it
+BCRYPT_ROUNDS = int(os.environ.get("SPARD_BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.environ.get("SPARD_BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Initialize the conflict checker and database
+conflict_checker = ConflictChecker(database_path=KNOWLEDGE_BASE_PATH)
+if KNOWLEDGE_BASE_POLL_SECONDS > 0:
+    conflict_checker.watch_database(KNOWLEDGE_BASE_POLL_SECONDS)
+conflict_checker.install_reload_signal()
+# Pre-serialized /medicines and /conflicts/<medicine> bodies, rebuilt per knowledge base version
+static_responses = StaticResponses(conflict_checker)
+db = DatabaseManager(password_hasher=PasswordHasher(rounds=BCRYPT_ROUNDS, workers=BCRYPT_WORKERS))
+atexit.register(db.close)
+# History is persisted off the request path; registered last so it drains before db closes
+history_writer = AnalysisHistoryWriter(db)
+atexit.register(history_writer.close)
+
+# Upper bound on prescription sets accepted by one /check-conflicts/batch request
+MAX_BATCH_SIZE = 10000
+# Longest single NDJSON record accepted by /check-conflicts/stream
+MAX_STREAM_RECORD_BYTES = 1024 * 1024
+
+
+class ApiResponse:
+    """
+    What a handler answers: a JSON payload, an already encoded JSON body (with its own
+    headers, e.g. a PrecomputedResponse), or an iterator of NDJSON lines
+    """
+    __slots__ = ("payload", "status", "headers", "body", "lines")
+
+    def __init__(self, payload: Any = None, status: int = 200, headers: Optional[Dict[str, str]] = None,
+                 body: Optional[bytes] = None, lines: Optional[Iterator[str]] = None):
+        self.payload = payload
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.lines = lines
+
+
+def error(message: str, status: int) -> ApiResponse:
+    return ApiResponse({"error": message}, status)
+
+
+def server_busy() -> ApiResponse:
+    """503 for auth requests shed because password hashing is saturated"""
+    return ApiResponse({"error": "Server is busy, please try again shortly"}, 503, {"Retry-After": "1"})
+
+
+def not_found() -> ApiResponse:
+    return ApiResponse({"error": "Endpoint not found", "message": "The requested resource does not exist"}, 404)
+
+
+def session_user(session_id: Optional[str]) -> Tuple[Optional[dict], Optional[ApiResponse]]:
+    """(user, None) for a valid or absent session, (None, 401 response) for an invalid one"""
+    if not session_id:
+        return None, None
+    user = db.get_session_user(session_id)
+    if not user:
+        return None, error("Invalid or expired session", 401)
+    return user, None
+
+
+def health_check() -> ApiResponse:
+    """GET /"""
+    return ApiResponse({
+        "status": "healthy",
+        "message": "Prescription Conflict Checker API is running",
+        "version": "1.0.0",
+        "database": "SQLite connected",
+        "knowledge_base_version": conflict_checker.data_version,
+        "password_hashing": db.password_hasher.stats()
+    })
+
+
+def signup(data: Any) -> ApiResponse:
+    """POST /auth/signup"""
+    try:
+        if not data:
+            return error("No JSON data provided", 400)
+
+        name = data.get('name', '').strip()
+        email = data.get('email', '').strip().lower()
+        password = data.get('password', '')
+
+        # Validation
+        if not name or not email or not password:
+            return error("Name, email, and password are required", 400)
+
+        if len(password) < 6:
+            return error("Password must be at least 6 characters long", 400)
+
+        # Create user
+        user = db.create_user(name, email, password)
+
+        if not user:
+            return error("Failed to create user", 500)
+
+        return ApiResponse({
+            "success": True,
+            "message": "Account created successfully",
+            "user": {
+                "id": user['id'],
+                "name": user['name'],
+                "email": user['email']
+            }
+        })
+
+    except ValueError as e:
+        return error(str(e), 400)
+    except TimeoutError:
+        return server_busy()
+    except Exception as e:
+        logger.error("Error in signup: %s", e)
+        return error("Internal server error", 500)
+
+
+def login(data: Any) -> ApiResponse:
+    """POST /auth/login"""
+    try:
+        if not data:
+            return error("No JSON data provided", 400)
+
+        email = data.get('email', '').strip().lower()
+        password = data.get('password', '')
+
+        if not email or not password:
+            return error("Email and password are required", 400)
+
+        # Authenticate user
+        user = db.authenticate_user(email, password)
+
+        if not user:
+            return error("Invalid email or password", 401)
+
+        # Create session
+        session_id = db.create_session(user['id'])
+
+        # Get user stats
+        stats = db.get_user_stats(user['id'])
+
+        return ApiResponse({
+            "success": True,
+            "message": "Login successful",
+            "user": {
+                "id": user['id'],
+                "name": user['name'],
+                "email": user['email'],
+                "last_login": user['last_login'],
+                "stats": stats
+            },
+            "session_id": session_id
+        })
+
+    except TimeoutError:
+        return server_busy()
+    except Exception as e:
+        logger.error("Error in login: %s", e)
+        return error("Internal server error", 500)
+
+
+def logout(data: Any) -> ApiResponse:
+    """POST /auth/logout"""
+    try:
+        session_id = data.get('session_id') if data else None
+
+        if session_id:
+            db.invalidate_session(session_id)
+
+        return ApiResponse({
+            "success": True,
+            "message": "Logout successful"
+        })
+
+    except Exception as e:
+        logger.error("Error in logout: %s", e)
+        return error("Internal server error", 500)
+
+
+def verify_session(data: Any) -> ApiResponse:
+    """POST /auth/verify"""
+    try:
+        session_id = data.get('session_id') if data else None
+
+        if not session_id:
+            return error("Session ID required", 400)
+
+        user, failure = session_user(session_id)
+        if failure:
+            return failure
+
+        return ApiResponse({
+            "success": True,
+            "user": {
+                "id": user['id'],
+                "name": user['name'],
+                "email": user['email']
+            }
+        })
+
+    except Exception as e:
+        logger.error("Error in verify session: %s", e)
+        return error("Internal server error", 500)
+
+
+def check_conflicts(data: Any) -> ApiResponse:
+    """
+    POST /check-conflicts: check for drug conflicts between two doctors' prescriptions,
+    saving the analysis to the user's history when a session is given
+    """
+    try:
+        if not data:
+            return error("No JSON data provided", 400)
+
+        # Check for session authentication
+        user, failure = session_user(data.get('session_id'))
+        if failure:
+            return failure
+
+        try:
+            doctor_a_medicines, doctor_b_medicines, user_allergies = parse_prescription(data)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        logger.debug("Processing medicines - Doctor A: %s, Doctor B: %s, User Allergies: %s",
+                     doctor_a_medicines, doctor_b_medicines, user_allergies)
+
+        # Check for conflicts using the conflict checker
+        result = conflict_checker.analyze_prescriptions(doctor_a_medicines, doctor_b_medicines, user_allergies)
+
+        # Save analysis result to database if user is authenticated
+        if user:
+            interactions_count = len(result.get('interactions', []))
+            risk_level = result.get('risk_level', 'LOW')
+
+            history_writer.submit(
+                user['id'],
+                doctor_a_medicines,
+                doctor_b_medicines,
+                interactions_count,
+                risk_level,
+                result
+            )
+
+            # Add user info to result
+            result['user_analysis_saved'] = True
+
+        logger.debug("Analysis result: %s", result)
+
+        return ApiResponse(result)
+
+    except Exception as e:
+        logger.error("Error in check_conflicts: %s", e)
+        return error(f"Internal server error: {str(e)}", 500)
+
+
+def parse_ndjson_lines(text: str) -> list:
+    """Records of an NDJSON document, one per line so indexes are line numbers; blank or unparsable lines become ValueErrors"""
+    records = []
+    for line in text.splitlines():
+        if not line.strip():
+            records.append(ValueError("Empty line"))
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as e:
+            records.append(ValueError(f"Invalid JSON: {e}"))
+    return records
+
+
+def check_conflicts_batch(session_id: Optional[str], data: Any = None, ndjson: Optional[str] = None) -> ApiResponse:
+    """
+    POST /check-conflicts/batch: analyze many prescription sets in one request
+
+    Args:
+        session_id: X-Session-ID header (a JSON body's session_id takes precedence)
+        data: Parsed JSON body - {"session_id": ..., "prescriptions": [...]} or a bare array
+        ndjson: NDJSON body text, one prescription set per line (instead of data)
+
+    Returns:
+        NDJSON lines in input order: {"index": i, "result": {...}} or {"index": i, "error": "..."}
+        per set, then a final {"summary": {...}} line. History for authenticated users is
+        saved with a single bulk insert once every set has been analyzed.
+    """
+    try:
+        if ndjson is not None:
+            prescriptions = parse_ndjson_lines(ndjson)
+        else:
+            if isinstance(data, dict):
+                session_id = data.get('session_id', session_id)
+                prescriptions = data.get('prescriptions')
+            else:
+                prescriptions = data
+
+            if not isinstance(prescriptions, list):
+                return error("Expected an array of prescription sets", 400)
+
+        if len(prescriptions) > MAX_BATCH_SIZE:
+            return error(f"Batch exceeds {MAX_BATCH_SIZE} prescription sets", 413)
+
+        user, failure = session_user(session_id)
+        if failure:
+            return failure
+
+        # Validate everything up front; only valid sets reach the checker
+        parsed = []
+        for item in prescriptions:
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                parsed.append(parse_prescription(item))
+            except ValueError as e:
+                parsed.append(e)
+        valid = [item for item in parsed if not isinstance(item, Exception)]
+
+        def generate():
+            results = conflict_checker.analyze_batch(valid)
+            history = []
+            errors = 0
+
+            for index, item in enumerate(parsed):
+                if isinstance(item, Exception):
+                    errors += 1
+                    yield json.dumps({"index": index, "error": str(item)}) + "\n"
+                    continue
+
+                result = next(results)
+                if user:
+                    history.append((user['id'], item[0], item[1], len(result['interactions']), result['risk_level'], result))
+                yield json.dumps({"index": index, "result": result}, default=json_default) + "\n"
+
+            summary = {"processed": len(parsed), "errors": errors, "saved": 0}
+            if history:
+                try:
+                    db.save_analysis_results(history)
+                    summary["saved"] = len(history)
+                except Exception as e:
+                    logger.error("Error saving batch analysis history: %s", e)
+                    summary["history_error"] = "Failed to save analysis history"
+            yield json.dumps({"summary": summary}) + "\n"
+
+        return ApiResponse(lines=generate())
+
+    except Exception as e:
+        logger.error("Error in check_conflicts_batch: %s", e)
+        return error(f"Internal server error: {str(e)}", 500)
+
+
+def read_ndjson_records(stream, max_record_bytes: int = MAX_STREAM_RECORD_BYTES):
+    """
+    Incrementally yield parsed records from a newline-delimited JSON stream
+
+    Every line yields one item, so a record's index is its 0-based line number. A line
+    that cannot be used (blank, too long or not JSON) is yielded as a ValueError so the
+    caller can report it inline and carry on with the next line.
+    """
+    while True:
+        line = stream.readline(max_record_bytes + 1)
+        if not line:
+            return
+
+        if len(line) > max_record_bytes:
+            # Discard the rest of the oversized record without buffering it
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_record_bytes + 1)
+            yield ValueError(f"Record exceeds {max_record_bytes} bytes")
+            continue
+
+        if not line.strip():
+            yield ValueError("Empty line")
+            continue
+
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+
+def stream_record(index: int, record: Any, user: Optional[dict]) -> Tuple[str, bool]:
+    """
+    One /check-conflicts/stream record: (NDJSON output line, True if it is an error line)
+    The analysis goes through the write-behind queue when user is set.
+    """
+    try:
+        if isinstance(record, Exception):
+            raise record
+        doctor_a_medicines, doctor_b_medicines, user_allergies = parse_prescription(record)
+        result = conflict_checker.analyze_prescriptions(doctor_a_medicines, doctor_b_medicines, user_allergies)
+    except ValueError as e:
+        return json.dumps({"index": index, "error": str(e)}) + "\n", True
+    except Exception as e:
+        logger.error("Error in check_conflicts_stream record %d: %s", index, e)
+        return json.dumps({"index": index, "error": "Internal server error"}) + "\n", True
+
+    if user:
+        history_writer.submit(user['id'], doctor_a_medicines, doctor_b_medicines,
+                              len(result['interactions']), result['risk_level'], result)
+    return json.dumps({"index": index, "result": result}, default=json_default) + "\n", False
+
+
+def stream_summary(processed: int, errors: int, user: Optional[dict]) -> str:
+    """
+    Final /check-conflicts/stream line
+    History goes through the write-behind queue, so "queued" counts analyses handed to it,
+    not rows already written (the batch endpoint's "saved" is reported after its insert).
+    """
+    return json.dumps({"summary": {"processed": processed, "errors": errors,
+                                   "queued": processed - errors if user else 0}}) + "\n"
+
+
+def check_conflicts_stream(session_id: Optional[str], records: Iterable[Any]) -> ApiResponse:
+    """
+    POST /check-conflicts/stream: analyze NDJSON prescription sets as they arrive
+
+    records are read lazily (see read_ndjson_records) and results stream back one
+    line per record, then a summary line, so memory stays flat however many are sent.
+    """
+    user, failure = session_user(session_id)
+    if failure:
+        return failure
+
+    def generate():
+        processed = errors = 0
+        for index, record in enumerate(records):
+            processed += 1
+            line, failed = stream_record(index, record, user)
+            errors += failed
+            yield line
+        yield stream_summary(processed, errors, user)
+
+    return ApiResponse(lines=generate())
+
+
+def parse_history_query(data: dict):
+    """(limit, cursor, summary) from an /analysis/history payload; ValueError with a client-facing message"""
+    limit = data.get('limit', 10)
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        raise ValueError("limit must be a positive integer")
+
+    cursor = data.get('cursor')
+    if cursor is not None and not isinstance(cursor, str):
+        raise ValueError("cursor must be a string")
+
+    fields = data.get('fields', 'full')
+    if fields not in ('full', 'summary'):
+        raise ValueError("fields must be 'full' or 'summary'")
+
+    return limit, cursor, fields == 'summary'
+
+
+def get_analysis_history(data: Any) -> ApiResponse:
+    """
+    POST /analysis/history: the user's analyses, newest first, one page at a time
+    Pass the response's next_cursor as cursor to get the following page (null on the last
+    page); limit is capped at MAX_HISTORY_PAGE_SIZE. fields="summary" leaves out full_result.
+    """
+    try:
+        session_id = data.get('session_id') if data else None
+
+        if not session_id:
+            return error("Session ID required", 400)
+
+        user, failure = session_user(session_id)
+        if failure:
+            return failure
+
+        try:
+            limit, cursor, summary = parse_history_query(data)
+            page = db.get_user_analysis_page(user['id'], limit, cursor, summary=summary)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        return ApiResponse({
+            "success": True,
+            "history": page['history'],
+            "next_cursor": page['next_cursor'],
+            "user": {
+                "name": user['name'],
+                "email": user['email']
+            }
+        })
+
+    except Exception as e:
+        logger.error("Error getting analysis history: %s", e)
+        return error("Internal server error", 500)
+
+
+def get_analysis_entry(data: Any, entry_id: int) -> ApiResponse:
+    """POST /analysis/history/<id>: one analysis from the user's history, with its full result"""
+    try:
+        session_id = data.get('session_id') if data else None
+
+        if not session_id:
+            return error("Session ID required", 400)
+
+        user, failure = session_user(session_id)
+        if failure:
+            return failure
+
+        entry = db.get_analysis_entry(user['id'], entry_id)
+
+        if not entry:
+            return error("Analysis not found", 404)
+
+        return ApiResponse({"success": True, "analysis": entry})
+
+    except Exception as e:
+        logger.error("Error getting analysis entry: %s", e)
+        return error("Internal server error", 500)
+
+
+def precomputed_response(cached, if_none_match: Optional[str], accept_encoding: Optional[str]) -> ApiResponse:
+    """Serve a PrecomputedResponse, honoring If-None-Match (304) and Accept-Encoding (gzip)"""
+    status, headers, body = cached.for_request(if_none_match, accept_encoding)
+    return ApiResponse(status=status, headers=headers, body=body)
+
+
+def get_known_medicines(if_none_match: Optional[str] = None, accept_encoding: Optional[str] = None) -> ApiResponse:
+    """GET /medicines: every medicine in the conflict database (frontend validation and autocomplete)"""
+    try:
+        return precomputed_response(static_responses.medicines(), if_none_match, accept_encoding)
+    except Exception as e:
+        return error(f"Error retrieving medicines: {str(e)}", 500)
+
+
+def get_medicine_conflicts(medicine: str, if_none_match: Optional[str] = None,
+                           accept_encoding: Optional[str] = None) -> ApiResponse:
+    """GET /conflicts/<medicine>"""
+    try:
+        medicine = medicine.lower().strip()
+        cached = static_responses.medicine_conflicts(medicine)
+
+        if cached is None:
+            return error(f"Medicine '{medicine}' not found in database", 404)
+
+        return precomputed_response(cached, if_none_match, accept_encoding)
+    except Exception as e:
+        return error(f"Error retrieving conflicts: {str(e)}", 500)
@@ -1,164 +1,69 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
 import sys
-import json
 
 # Add the current directory to Python path to import modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from conflict_checker import ConflictChecker
-from database import DatabaseManager
+import api
+from api import ApiResponse, db
+from records import Record
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """jsonify() support for the slotted records analyses and knowledge base lookups return"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize the conflict checker and database
-conflict_checker = ConflictChecker()
-db = DatabaseManager()
+# Route logic lives in api.py (shared with asgi.py); these views only adapt Flask's request and response
+
+def request_data():
+    """The JSON body, or None if it is missing or not valid JSON (whatever the Content-Type)"""
+    return request.get_json(force=True, silent=True)
+
+def flask_response(response: ApiResponse):
+    """Turn a handler's ApiResponse into a Flask response"""
+    if response.lines is not None:
+        return app.response_class(stream_with_context(response.lines), status=response.status,
+                                  headers=response.headers, mimetype='application/x-ndjson')
+    if response.body is not None:
+        return app.response_class(response.body, status=response.status, headers=response.headers,
+                                  mimetype='application/json')
+    return jsonify(response.payload), response.status, response.headers
 
 @app.route('/', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        "status": "healthy",
-        "message": "Prescription Conflict Checker API is running",
-        "version": "1.0.0",
-        "database": "SQLite connected"
-    })
+    return flask_response(api.health_check())
 
 @app.route('/auth/signup', methods=['POST'])
 def signup():
     """User registration endpoint"""
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-        
-        name = data.get('name', '').strip()
-        email = data.get('email', '').strip().lower()
-        password = data.get('password', '')
-        
-        # Validation
-        if not name or not email or not password:
-            return jsonify({"error": "Name, email, and password are required"}), 400
-        
-        if len(password) < 6:
-            return jsonify({"error": "Password must be at least 6 characters long"}), 400
-        
-        # Create user
-        user = db.create_user(name, email, password)
-        
-        if not user:
-            return jsonify({"error": "Failed to create user"}), 500
-        
-        return jsonify({
-            "success": True,
-            "message": "Account created successfully",
-            "user": {
-                "id": user['id'],
-                "name": user['name'],
-                "email": user['email']
-            }
-        })
-        
-    except ValueError as e:
-        return jsonify({"error": str(e)}), 400
-    except Exception as e:
-        print(f"Error in signup: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+    return flask_response(api.signup(request_data()))
 
 @app.route('/auth/login', methods=['POST'])
 def login():
     """User login endpoint"""
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-        
-        email = data.get('email', '').strip().lower()
-        password = data.get('password', '')
-        
-        if not email or not password:
-            return jsonify({"error": "Email and password are required"}), 400
-        
-        # Authenticate user
-        user = db.authenticate_user(email, password)
-        
-        if not user:
-            return jsonify({"error": "Invalid email or password"}), 401
-        
-        # Create session
-        session_id = db.create_session(user['id'])
-        
-        # Get user stats
-        stats = db.get_user_stats(user['id'])
-        
-        return jsonify({
-            "success": True,
-            "message": "Login successful",
-            "user": {
-                "id": user['id'],
-                "name": user['name'],
-                "email": user['email'],
-                "last_login": user['last_login'],
-                "stats": stats
-            },
-            "session_id": session_id
-        })
-        
-    except Exception as e:
-        print(f"Error in login: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+    return flask_response(api.login(request_data()))
 
 @app.route('/auth/logout', methods=['POST'])
 def logout():
     """User logout endpoint"""
-    try:
-        data = request.get_json()
-        session_id = data.get('session_id') if data else None
-        
-        if session_id:
-            db.invalidate_session(session_id)
-        
-        return jsonify({
-            "success": True,
-            "message": "Logout successful"
-        })
-        
-    except Exception as e:
-        print(f"Error in logout: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+    return flask_response(api.logout(request_data()))
 
 @app.route('/auth/verify', methods=['POST'])
 def verify_session():
     """Verify user session"""
-    try:
-        data = request.get_json()
-        session_id = data.get('session_id') if data else None
-        
-        if not session_id:
-            return jsonify({"error": "Session ID required"}), 400
-        
-        user = db.get_session_user(session_id)
-        
-        if not user:
-            return jsonify({"error": "Invalid or expired session"}), 401
-        
-        return jsonify({
-            "success": True,
-            "user": {
-                "id": user['id'],
-                "name": user['name'],
-                "email": user['email']
-            }
-        })
-        
-    except Exception as e:
-        print(f"Error in verify session: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+    return flask_response(api.verify_session(request_data()))
 
 @app.route('/check-conflicts', methods=['POST'])
 def check_conflicts():
@@ -166,112 +71,41 @@ def check_conflicts():
     Main endpoint to check for drug conflicts between two doctors' prescriptions
     Now includes user authentication and saves analysis history
     """
-    try:
-        # Get JSON data from request
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "error": "No JSON data provided"
-            }), 400
-        
-        # Check for session authentication
-        session_id = data.get('session_id')
-        user = None
-        
-        if session_id:
-            user = db.get_session_user(session_id)
-            if not user:
-                return jsonify({"error": "Invalid or expired session"}), 401
-        
-        # Extract medicine lists and user allergies
-        doctor_a_medicines = data.get('doctorA_medicines', [])
-        doctor_b_medicines = data.get('doctorB_medicines', [])
-        user_allergies = data.get('user_allergies', [])
-        
-        # Validate input
-        if not isinstance(doctor_a_medicines, list) or not isinstance(doctor_b_medicines, list):
-            return jsonify({
-                "error": "Medicine lists must be arrays"
-            }), 400
-            
-        if not isinstance(user_allergies, list):
-            return jsonify({
-                "error": "User allergies must be an array"
-            }), 400
-        
-        if len(doctor_a_medicines) == 0 and len(doctor_b_medicines) == 0:
-            return jsonify({
-                "error": "At least one medicine list must contain medicines"
-            }), 400
-        
-        # Clean and normalize medicine names
-        doctor_a_medicines = [medicine.lower().strip() for medicine in doctor_a_medicines if medicine.strip()]
-        doctor_b_medicines = [medicine.lower().strip() for medicine in doctor_b_medicines if medicine.strip()]
-        user_allergies = [allergy.strip() for allergy in user_allergies if allergy.strip()]
-        
-        print(f"Processing medicines - Doctor A: {doctor_a_medicines}, Doctor B: {doctor_b_medicines}, User Allergies: {user_allergies}")
-        
-        # Check for conflicts using the conflict checker
-        result = conflict_checker.analyze_prescriptions(doctor_a_medicines, doctor_b_medicines, user_allergies)
-        
-        # Save analysis result to database if user is authenticated
-        if user:
-            interactions_count = len(result.get('interactions', []))
-            risk_level = result.get('risk_level', 'LOW')
-            
-            db.save_analysis_result(
-                user['id'], 
-                doctor_a_medicines, 
-                doctor_b_medicines, 
-                interactions_count, 
-                risk_level, 
-                result
-            )
-            
-            # Add user info to result
-            result['user_analysis_saved'] = True
-        
-        print(f"Analysis result: {result}")
-        
-        return jsonify(result)
-        
-    except Exception as e:
-        print(f"Error in check_conflicts: {str(e)}")
-        return jsonify({
-            "error": f"Internal server error: {str(e)}"
-        }), 500
+    return flask_response(api.check_conflicts(request_data()))
+
+@app.route('/check-conflicts/batch', methods=['POST'])
+def check_conflicts_batch():
+    """
+    Analyze many prescription sets in one request (e.g. overnight pharmacy screening)
+    
+    Accepts either JSON - {"session_id": ..., "prescriptions": [...]} or a bare array -
+    or NDJSON (Content-Type: application/x-ndjson) with one prescription set per line.
+    NDJSON callers pass their session in the X-Session-ID header.
+    """
+    session_id = request.headers.get('X-Session-ID')
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return flask_response(api.check_conflicts_batch(session_id, ndjson=request.get_data(as_text=True)))
+    return flask_response(api.check_conflicts_batch(session_id, data=request_data()))
+
+@app.route('/check-conflicts/stream', methods=['POST'])
+def check_conflicts_stream():
+    """
+    Streaming variant of /check-conflicts for very large batch jobs
+    Reads NDJSON prescription sets from the request body as they arrive; pass the
+    session in the X-Session-ID header.
+    """
+    return flask_response(api.check_conflicts_stream(request.headers.get('X-Session-ID'),
+                                                     api.read_ndjson_records(request.stream)))
 
 @app.route('/analysis/history', methods=['POST'])
 def get_analysis_history():
-    """Get user's analysis history"""
-    try:
-        data = request.get_json()
-        session_id = data.get('session_id') if data else None
-        
-        if not session_id:
-            return jsonify({"error": "Session ID required"}), 400
-        
-        user = db.get_session_user(session_id)
-        
-        if not user:
-            return jsonify({"error": "Invalid or expired session"}), 401
-        
-        limit = data.get('limit', 10)
-        history = db.get_user_analysis_history(user['id'], limit)
-        
-        return jsonify({
-            "success": True,
-            "history": history,
-            "user": {
-                "name": user['name'],
-                "email": user['email']
-            }
-        })
-        
-    except Exception as e:
-        print(f"Error getting analysis history: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+    """Get user's analysis history, newest first, one page at a time"""
+    return flask_response(api.get_analysis_history(request_data()))
+
+@app.route('/analysis/history/<int:entry_id>', methods=['POST'])
+def get_analysis_entry(entry_id):
+    """Get one analysis from the user's history, with its full result"""
+    return flask_response(api.get_analysis_entry(request_data(), entry_id))
 
 @app.route('/medicines', methods=['GET'])
 def get_known_medicines():
@@ -279,46 +113,20 @@ def get_known_medicines():
     Get list of all medicines in the conflict database
     Useful for frontend validation and autocomplete
     """
-    try:
-        medicines = conflict_checker.get_all_known_medicines()
-        return jsonify({
-            "medicines": medicines,
-            "count": len(medicines)
-        })
-    except Exception as e:
-        return jsonify({
-            "error": f"Error retrieving medicines: {str(e)}"
-        }), 500
+    return flask_response(api.get_known_medicines(request.headers.get('If-None-Match'),
+                                                  request.headers.get('Accept-Encoding')))
 
 @app.route('/conflicts/<medicine>', methods=['GET'])
 def get_medicine_conflicts(medicine):
     """
     Get conflicts for a specific medicine
     """
-    try:
-        medicine = medicine.lower().strip()
-        conflicts = conflict_checker.get_medicine_conflicts(medicine)
-        
-        if conflicts is None:
-            return jsonify({
-                "error": f"Medicine '{medicine}' not found in database"
-            }), 404
-        
-        return jsonify({
-            "medicine": medicine,
-            "conflicts": conflicts
-        })
-    except Exception as e:
-        return jsonify({
-            "error": f"Error retrieving conflicts: {str(e)}"
-        }), 500
+    return flask_response(api.get_medicine_conflicts(medicine, request.headers.get('If-None-Match'),
+                                                     request.headers.get('Accept-Encoding')))
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({
-        "error": "Endpoint not found",
-        "message": "The requested resource does not exist"
-    }), 404
+    return flask_response(api.not_found())
 
 @app.errorhandler(500)
 def internal_error(error):
@@ -341,7 +149,10 @@ if __name__ == '__main__':
     print("  POST /auth/logout         - User logout")
     print("  POST /auth/verify         - Verify session")
     print("  POST /check-conflicts     - Check for drug conflicts")
-    print("  POST /analysis/history    - Get analysis history")
+    print("  POST /check-conflicts/batch - Check many prescription sets (JSON array or NDJSON)")
+    print("  POST /check-conflicts/stream - Stream NDJSON prescription sets in, results out")
+    print("  POST /analysis/history    - Get analysis history (paginated)")
+    print("  POST /analysis/history/<id> - Get one analysis with its full result")
     print("  GET  /medicines           - Get all known medicines")
     print("  GET  /conflicts/<medicine> - Get conflicts for specific medicine")
     print()
@@ -0,0 +1,301 @@
+"""
+ASGI (asyncio) variant of the SPARD API
+Serves the same routes as app.py with the same handlers (api.py): this module only
+reads requests, routes them and writes api.ApiResponses. Handlers block on the
+database, so they run on thread executors and the event loop never waits on SQLite.
+
+Run it under the same pre-fork master as the WSGI app, with uvicorn workers:
+    gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker asgi:app
+(older uvicorn releases bundle the worker as uvicorn.workers.UvicornWorker). A single
+`uvicorn asgi:app` works too; prefer gunicorn over `uvicorn --workers`, whose shared
+listening socket leaves Nagle's algorithm on and adds ~40 ms to keep-alive requests.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, List, Tuple
+
+import api
+from api import ApiResponse, db
+from static_responses import dump_json
+
+logger = logging.getLogger(__name__)
+
+# Threads running handlers that touch the database; defaults to one per pooled connection plus headroom
+DB_THREADS = int(os.environ.get("SPARD_DB_THREADS", str(db.pool.size + 3)))
+# Logins and signups wait on the bcrypt pool; separate threads keep a login storm
+# from tying up the ones session lookups need
+AUTH_THREADS = int(os.environ.get("SPARD_AUTH_THREADS", "4"))
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="asgi-db")
+_auth_executor = ThreadPoolExecutor(max_workers=AUTH_THREADS, thread_name_prefix="asgi-auth")
+
+
+async def run_db(func: Callable, *args) -> Any:
+    """Run a blocking handler or database call on the database executor"""
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, func, *args)
+
+
+async def run_auth(func: Callable, *args) -> Any:
+    """Run a password-checking handler on the auth executor"""
+    return await asyncio.get_running_loop().run_in_executor(_auth_executor, func, *args)
+
+
+class Request:
+    """The parts of an ASGI HTTP request the handlers use"""
+
+    def __init__(self, scope: dict, receive: Callable):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                        for name, value in scope.get("headers", [])}
+        self._receive = receive
+
+    @property
+    def mimetype(self) -> str:
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Body chunks as they arrive"""
+        while True:
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            if chunk:
+                yield chunk
+            if not message.get("more_body", False):
+                return
+
+    async def body(self) -> bytes:
+        return b"".join([chunk async for chunk in self.stream()])
+
+    async def json(self) -> Any:
+        """Parsed JSON body, or None if it is empty or not valid JSON"""
+        try:
+            return json.loads(await self.body())
+        except ValueError:
+            return None
+
+
+async def send_response(send: Callable, response: ApiResponse, cors_headers: List[Tuple[bytes, bytes]]):
+    """Write an ApiResponse; lines may be an iterator of NDJSON lines or an async one"""
+    headers = cors_headers + [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                              for name, value in response.headers.items()]
+    if response.lines is None:
+        if response.status == 304:
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        body = dump_json(response.payload) if response.body is None else response.body
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": response.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+        return
+
+    headers.append((b"content-type", b"application/x-ndjson"))
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    if hasattr(response.lines, "__aiter__"):
+        async for line in response.lines:
+            await send({"type": "http.response.body", "body": line.encode(), "more_body": True})
+    else:
+        for line in response.lines:
+            await send({"type": "http.response.body", "body": line.encode(), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def read_ndjson_records(request: Request, max_record_bytes: int) -> AsyncIterator[Any]:
+    """
+    Async counterpart of api.read_ndjson_records over the request body
+    Yields parsed records, or a ValueError for a line that cannot be used.
+    """
+    pending = b""
+    oversized = False
+    async for chunk in request.stream():
+        pending += chunk
+        while True:
+            newline = pending.find(b"\n")
+            if newline < 0:
+                if len(pending) > max_record_bytes:
+                    # Drop what we have of the oversized record and keep discarding to its end
+                    if not oversized:
+                        oversized = True
+                        yield ValueError(f"Record exceeds {max_record_bytes} bytes")
+                    pending = b""
+                break
+            line, pending = pending[:newline], pending[newline + 1:]
+            if oversized:
+                oversized = False
+                continue
+            if len(line) > max_record_bytes:
+                yield ValueError(f"Record exceeds {max_record_bytes} bytes")
+            elif not line.strip():
+                yield ValueError("Empty line")
+            else:
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ValueError(f"Invalid JSON: {e}")
+    if pending and not oversized:
+        if not pending.strip():
+            yield ValueError("Empty line")
+        else:
+            try:
+                yield json.loads(pending)
+            except ValueError as e:
+                yield ValueError(f"Invalid JSON: {e}")
+
+
+async def health_check(request: Request) -> ApiResponse:
+    return api.health_check()
+
+
+async def signup(request: Request) -> ApiResponse:
+    return await run_auth(api.signup, await request.json())
+
+
+async def login(request: Request) -> ApiResponse:
+    return await run_auth(api.login, await request.json())
+
+
+async def logout(request: Request) -> ApiResponse:
+    return await run_db(api.logout, await request.json())
+
+
+async def verify_session(request: Request) -> ApiResponse:
+    return await run_db(api.verify_session, await request.json())
+
+
+async def check_conflicts(request: Request) -> ApiResponse:
+    return await run_db(api.check_conflicts, await request.json())
+
+
+async def check_conflicts_batch(request: Request) -> ApiResponse:
+    session_id = request.headers.get('x-session-id')
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        response = await run_db(lambda body: api.check_conflicts_batch(session_id, ndjson=body),
+                                (await request.body()).decode())
+    else:
+        response = await run_db(api.check_conflicts_batch, session_id, await request.json())
+    if response.lines is not None:
+        # Up to MAX_BATCH_SIZE analyses and a bulk insert: run them off the loop
+        response.lines = await run_db(list, response.lines)
+    return response
+
+
+async def check_conflicts_stream(request: Request) -> ApiResponse:
+    user, failure = await run_db(api.session_user, request.headers.get('x-session-id'))
+    if failure:
+        return failure
+
+    async def generate():
+        processed = errors = 0
+        async for record in read_ndjson_records(request, api.MAX_STREAM_RECORD_BYTES):
+            # Analysis alone is sub-millisecond and usually cached: cheaper on the loop than
+            # a thread hop. Queueing history can block briefly, so that runs on the executor.
+            if user:
+                line, failed = await run_db(api.stream_record, processed, record, user)
+            else:
+                line, failed = api.stream_record(processed, record, None)
+            processed += 1
+            errors += failed
+            yield line
+        yield api.stream_summary(processed, errors, user)
+
+    return ApiResponse(lines=generate())
+
+
+async def get_analysis_history(request: Request) -> ApiResponse:
+    return await run_db(api.get_analysis_history, await request.json())
+
+
+async def get_analysis_entry(request: Request, entry_id: str) -> ApiResponse:
+    return await run_db(api.get_analysis_entry, await request.json(), int(entry_id))
+
+
+async def get_known_medicines(request: Request) -> ApiResponse:
+    return api.get_known_medicines(request.headers.get('if-none-match'), request.headers.get('accept-encoding'))
+
+
+async def get_medicine_conflicts(request: Request, medicine: str) -> ApiResponse:
+    return api.get_medicine_conflicts(medicine, request.headers.get('if-none-match'),
+                                      request.headers.get('accept-encoding'))
+
+
+# (method, path pattern, handler); path groups become handler arguments
+ROUTES: List[Tuple[str, "re.Pattern", Callable]] = [
+    ("GET", re.compile(r"/"), health_check),
+    ("POST", re.compile(r"/auth/signup"), signup),
+    ("POST", re.compile(r"/auth/login"), login),
+    ("POST", re.compile(r"/auth/logout"), logout),
+    ("POST", re.compile(r"/auth/verify"), verify_session),
+    ("POST", re.compile(r"/check-conflicts"), check_conflicts),
+    ("POST", re.compile(r"/check-conflicts/batch"), check_conflicts_batch),
+    ("POST", re.compile(r"/check-conflicts/stream"), check_conflicts_stream),
+    ("POST", re.compile(r"/analysis/history"), get_analysis_history),
+    ("POST", re.compile(r"/analysis/history/(\d+)"), get_analysis_entry),
+    ("GET", re.compile(r"/medicines"), get_known_medicines),
+    ("GET", re.compile(r"/conflicts/([^/]+)"), get_medicine_conflicts),
+]
+
+
+async def dispatch(request: Request) -> ApiResponse:
+    allowed = []
+    for method, pattern, handler in ROUTES:
+        match = pattern.fullmatch(request.path)
+        if not match:
+            continue
+        if method != request.method:
+            allowed.append(method)
+            continue
+        try:
+            return await handler(request, *match.groups())
+        except Exception as e:
+            logger.error("Error in %s: %s", handler.__name__, e)
+            return api.error("Internal server error", 500)
+
+    if allowed:
+        return ApiResponse({"error": "Method not allowed"}, 405, {"Allow": ", ".join(allowed + ["OPTIONS"])})
+    return api.not_found()
+
+
+async def lifespan(receive: Callable, send: Callable):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await run_db(db.cleanup_expired_sessions)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Pending history and pooled connections are flushed by api's atexit handlers
+            _db_executor.shutdown(wait=True)
+            _auth_executor.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: dict, receive: Callable, send: Callable):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    request = Request(scope, receive)
+    # Same policy as flask_cors' defaults in app.py: any origin
+    cors_headers = [(b"access-control-allow-origin", b"*")]
+
+    if request.method == "OPTIONS":
+        methods = sorted({method for method, pattern, _ in ROUTES if pattern.fullmatch(request.path)})
+        cors_headers += [(b"access-control-allow-methods", ", ".join(methods).encode())]
+        requested = request.headers.get("access-control-request-headers")
+        if requested:
+            cors_headers.append((b"access-control-allow-headers", requested.encode("latin-1")))
+        await send_response(send, ApiResponse({}, 200 if methods else 404), cors_headers)
+        return
+
+    await send_response(send, await dispatch(request), cors_headers)
@@ -0,0 +1,950 @@
+"""
+Performance benchmarks for Prescription Conflict Checker
+Usage: python benchmark.py <benchmark> [options]
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict
+
+# Add the current directory to Python path to import modules
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BACKEND_DIR)
+
+SAMPLE_REQUEST = {
+    "doctorA_medicines": ["metformin", "ibuprofen", "lisinopril", "warfarin", "amlodipine"],
+    "doctorB_medicines": ["aspirin", "amoxicillin", "atenolol", "omeprazole", "clopidogrel"],
+    "user_allergies": ["penicillin", "nsaid", "sulfa", "latex", "ace_inhibitors"]
+}
+
+
+def load_app(workdir: str):
+    """Import the Flask app against a scratch copy of the database in workdir; its services are then in api"""
+    shutil.copy(os.path.join(BACKEND_DIR, "prescription_checker.db"), workdir)
+    os.chdir(workdir)
+    return importlib.import_module("app")
+
+
+def report(label: str, count: int, elapsed: float, unit: str = "req"):
+    print(f"  {label:<28} {count / elapsed:>10.1f} {unit}/s  ({elapsed * 1000 / count:.3f} ms/{unit})")
+
+
+def bench_logging(args):
+    """Compare /check-conflicts throughput with DEBUG logging on and off"""
+    from logging_config import setup_logging
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Formatted records go to /dev/null so we measure logging cost, not the terminal
+        with open(os.devnull, "w") as sink:
+            setup_logging("INFO", stream=sink)
+            client = load_app(workdir).app.test_client()
+
+            print(f"/check-conflicts, {args.requests} requests per level")
+            for level in ("DEBUG", "INFO"):
+                logging.getLogger().setLevel(level)
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    client.post("/check-conflicts", json=SAMPLE_REQUEST)
+                report(f"log level {level}", args.requests, time.perf_counter() - start)
+
+
+def bench_db_pool(args):
+    """Compare get_session_user latency with a fresh connection per call vs pooled connections (and the session cache)"""
+    from database import DatabaseManager
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "prescription_checker.db")
+        shutil.copy(os.path.join(BACKEND_DIR, "prescription_checker.db"), db_path)
+
+        print(f"get_session_user, {args.requests} calls per configuration")
+        for label, pool_size, cache_size in (("connect per call", 0, 0), ("pooled (size 5)", 5, 0),
+                                             ("pooled + session cache", 5, 4096)):
+            # Session cache off except in the last row: measure the database round trip itself
+            db = DatabaseManager(db_path, pool_size=pool_size, session_cache_size=cache_size)
+            session_id = db.create_session(db.get_user_by_email("demo@example.com")["id"])
+
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                db.get_session_user(session_id)
+            report(label, args.requests, time.perf_counter() - start, unit="call")
+            db.close()
+
+
+def bench_db_profile(args):
+    """Mixed reader/writer throughput against prescription_checker.db for each PRAGMA profile"""
+    from database import DatabaseManager, PRAGMA_PROFILES
+
+    print(f"{args.readers} readers + {args.writers} writers for {args.duration}s per profile")
+    for profile in PRAGMA_PROFILES:
+        with tempfile.TemporaryDirectory() as workdir:
+            db_path = os.path.join(workdir, "prescription_checker.db")
+            shutil.copy(os.path.join(BACKEND_DIR, "prescription_checker.db"), db_path)
+            db = DatabaseManager(db_path, pool_size=args.readers + args.writers, profile=profile)
+            user_id = db.get_user_by_email("demo@example.com")["id"]
+            session_id = db.create_session(user_id)
+            result = {"interactions": [], "risk_level": "LOW", **SAMPLE_REQUEST}
+
+            counts = {"read": 0, "write": 0}
+            stop = threading.Event()
+
+            def reader():
+                while not stop.is_set():
+                    db.get_session_user(session_id)
+                    db.get_user_analysis_history(user_id, 10)
+                    counts["read"] += 1
+
+            def writer():
+                while not stop.is_set():
+                    db.save_analysis_result(user_id, SAMPLE_REQUEST["doctorA_medicines"],
+                                            SAMPLE_REQUEST["doctorB_medicines"], 0, "LOW", result)
+                    counts["write"] += 1
+
+            threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+            threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+            for thread in threads:
+                thread.start()
+            time.sleep(args.duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            db.close()
+
+            print(f"  {profile:<12} reads {counts['read'] / args.duration:>9.1f}/s  "
+                  f"writes {counts['write'] / args.duration:>9.1f}/s")
+
+
+def seed_history(db, users: int, rows: int, sessions: int):
+    """Bulk-insert synthetic analysis history spread over the past year, plus sessions"""
+    import json
+    import random
+    import uuid
+    from database import compress_result, result_digest
+
+    rng = random.Random(42)
+    blob = json.dumps({"interactions": [], "risk_level": "LOW", **SAMPLE_REQUEST})
+    digest = result_digest(blob)
+    medicines = json.dumps(SAMPLE_REQUEST["doctorA_medicines"])
+
+    with db._connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)",
+            ((f"User {i}", f"user{i}@bench.local", "x") for i in range(users))
+        )
+        first_user = conn.execute("SELECT MIN(id) FROM users WHERE email LIKE '%@bench.local'").fetchone()[0]
+        conn.execute("INSERT OR IGNORE INTO analysis_results (hash, result) VALUES (?, ?)", (digest, compress_result(blob)))
+
+        batch = 100000
+        for offset in range(0, rows, batch):
+            conn.executemany(
+                "INSERT INTO analysis_history (user_id, doctor_a_medicines, doctor_b_medicines, interactions_found, "
+                "risk_level, result_hash, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?))",
+                ((first_user + rng.randrange(users), medicines, medicines, rng.randrange(4),
+                  rng.choice(("LOW", "MEDIUM", "HIGH")), digest, f"-{rng.randrange(365 * 24 * 3600)} seconds")
+                 for _ in range(min(batch, rows - offset)))
+            )
+        conn.executemany(
+            "INSERT INTO sessions (id, user_id, expires_at, is_active) VALUES (?, ?, datetime('now', ?), ?)",
+            ((str(uuid.uuid4()), first_user + rng.randrange(users), f"{rng.randrange(-30, 7)} days", rng.random() < 0.1)
+             for _ in range(sessions))
+        )
+    db.reconcile_user_stats()
+    return first_user
+
+
+def bench_db_indexes(args):
+    """History, stats and session-cleanup query latency on a large seeded history, before and after migrations"""
+    from database import DatabaseManager, SCHEMA_MIGRATIONS
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = DatabaseManager(os.path.join(workdir, "bench.db"))
+        print(f"Seeding {args.rows} history rows across {args.users} users...")
+        first_user = seed_history(db, args.users, args.rows, sessions=args.rows // 10)
+
+        queries = {
+            "get_user_analysis_history": lambda user_id: db.get_user_analysis_history(user_id, 10),
+            "get_user_stats": db.get_user_stats,
+            "cleanup_expired_sessions": lambda user_id: db.cleanup_expired_sessions()
+        }
+
+        # The migrated schema's indexes, recreated verbatim for the second run
+        with db._connection() as conn:
+            indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall()
+
+        for label in ("without indexes", "with indexes"):
+            with db._connection() as conn:
+                for name, sql in indexes:
+                    conn.execute(f"DROP INDEX {name}" if label == "without indexes" else sql)
+            if label == "with indexes":
+                print(f"  (indexes from schema version {len(SCHEMA_MIGRATIONS)})")
+
+            print(f"{label}, {args.queries} calls per query")
+            for name, query in queries.items():
+                start = time.perf_counter()
+                for i in range(args.queries):
+                    query(first_user + i % args.users)
+                report(name, args.queries, time.perf_counter() - start, unit="call")
+        db.close()
+
+
+def bench_history_pages(args):
+    """/analysis/history for one user with a long history: full vs summary pages, OFFSET vs keyset paging"""
+    import json
+    from database import DatabaseManager, MAX_HISTORY_PAGE_SIZE, decompress_result
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = DatabaseManager(os.path.join(workdir, "bench.db"))
+        print(f"Seeding {args.rows} history rows for one user...")
+        user_id = seed_history(db, 1, args.rows, sessions=0)
+        page_size = 20
+        depth = min(args.rows // 2, 50000)
+
+        def offset_page(offset: int):
+            # What a client could do before: LIMIT/OFFSET, decoding every blob
+            with db._connection() as conn:
+                rows = conn.execute(
+                    "SELECT h.doctor_a_medicines, h.doctor_b_medicines, h.interactions_found, h.risk_level, h.created_at, "
+                    "r.result FROM analysis_history h JOIN analysis_results r ON r.hash = h.result_hash "
+                    "WHERE h.user_id = ? ORDER BY h.created_at DESC LIMIT ? OFFSET ?",
+                    (user_id, page_size, offset)).fetchall()
+            return [(json.loads(a), json.loads(b), n, risk, date, decompress_result(blob))
+                    for a, b, n, risk, date, blob in rows]
+
+        # Cursor that starts a page `depth` rows in
+        cursor, skipped = None, 0
+        while skipped < depth:
+            page = db.get_user_analysis_page(user_id, min(MAX_HISTORY_PAGE_SIZE, depth - skipped), cursor, summary=True)
+            cursor = page["next_cursor"]
+            skipped += len(page["history"])
+
+        print(f"{page_size} entries per page, {args.queries} calls each")
+        for label, call in (
+            ("first page, full", lambda: db.get_user_analysis_page(user_id, page_size)),
+            ("first page, summary", lambda: db.get_user_analysis_page(user_id, page_size, summary=True)),
+            (f"row {depth}, OFFSET", lambda: offset_page(depth)),
+            (f"row {depth}, keyset cursor", lambda: db.get_user_analysis_page(user_id, page_size, cursor)),
+            (f"row {depth}, keyset summary", lambda: db.get_user_analysis_page(user_id, page_size, cursor, summary=True)),
+        ):
+            start = time.perf_counter()
+            for _ in range(args.queries):
+                call()
+            report(label, args.queries, time.perf_counter() - start, unit="page")
+
+        start = time.perf_counter()
+        cursor, pages = None, 0
+        while True:
+            page = db.get_user_analysis_page(user_id, MAX_HISTORY_PAGE_SIZE, cursor, summary=True)
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        elapsed = time.perf_counter() - start
+        print(f"  walked all {args.rows} rows in {pages} summary pages of {MAX_HISTORY_PAGE_SIZE}: {elapsed * 1000:.0f} ms")
+        db.close()
+
+
+def bench_result_store(args):
+    """A year of analysis history: inline JSON results vs compressed, content-addressed results (size, writes, migration)"""
+    import json
+    import random
+    import database
+    from conflict_checker import ConflictChecker
+    from database import DatabaseManager
+    from records import json_default
+
+    # Patients are re-checked on the same regimen, so a year of traffic repeats a bounded set of results
+    checker = ConflictChecker()
+    regimens = []
+    for prescription in random_prescriptions(args.regimens, 5):
+        result = checker.analyze_prescriptions(prescription["doctorA_medicines"], prescription["doctorB_medicines"],
+                                               prescription["user_allergies"])
+        regimens.append((prescription["doctorA_medicines"], prescription["doctorB_medicines"],
+                         len(result.get("interactions", [])), result.get("risk_level", "LOW"), result))
+    rng = random.Random(5)
+    records = [(1 + rng.randrange(args.users), *rng.choice(regimens)) for _ in range(args.rows)]
+    batch = 200
+
+    def legacy_save(db, chunk):
+        # save_analysis_results as it was before analysis_results: the JSON inline in every row
+        with db._connection() as conn:
+            conn.executemany(
+                "INSERT INTO analysis_history (user_id, doctor_a_medicines, doctor_b_medicines, interactions_found, "
+                "risk_level, analysis_result) VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, json.dumps(a), json.dumps(b), n, risk, json.dumps(result, default=json_default))
+                 for user_id, a, b, n, risk, result in chunk])
+            conn.executemany(
+                "INSERT INTO user_stats (user_id, total_analyses, high_risk_analyses) VALUES (?, 1, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET total_analyses = total_analyses + 1, "
+                "high_risk_analyses = high_risk_analyses + excluded.high_risk_analyses",
+                [(record[0], int(record[4] == "HIGH")) for record in chunk])
+            conn.executemany(
+                "INSERT INTO user_daily_stats (user_id, day, analyses) VALUES (?, date('now'), 1) "
+                "ON CONFLICT (user_id, day) DO UPDATE SET analyses = analyses + 1",
+                [(record[0],) for record in chunk])
+
+    def write_all(db, save) -> float:
+        start = time.perf_counter()
+        for offset in range(0, len(records), batch):
+            save(db, records[offset:offset + batch])
+        return time.perf_counter() - start
+
+    def result_bytes(db, sql) -> int:
+        with db._connection() as conn:
+            return conn.execute(sql).fetchone()[0]
+
+    print(f"{args.rows} analyses by {args.users} users over {args.regimens} distinct regimens, "
+          f"saved in batches of {batch}")
+    print(f"  {'':<30} {'file MB':>8} {'results MB':>11} {'saves/s':>9}")
+    with tempfile.TemporaryDirectory() as workdir:
+        legacy_path = os.path.join(workdir, "legacy.db")
+        current = database.SCHEMA_MIGRATIONS
+        database.SCHEMA_MIGRATIONS = current[:3]  # migrations 1-3: the schema before analysis_results
+        try:
+            legacy = DatabaseManager(legacy_path)
+        finally:
+            database.SCHEMA_MIGRATIONS = current
+        elapsed = write_all(legacy, legacy_save)
+        size = legacy.vacuum()[1]
+        stored = result_bytes(legacy, "SELECT SUM(length(analysis_result)) FROM analysis_history")
+        legacy.close()
+        print(f"  {'inline JSON results':<30} {size / 1e6:>8.1f} {stored / 1e6:>11.1f} {args.rows / elapsed:>9.0f}")
+
+        migrated_path = os.path.join(workdir, "migrated.db")
+        shutil.copy(legacy_path, migrated_path)
+        start = time.perf_counter()
+        migrated = DatabaseManager(migrated_path)
+        migration = time.perf_counter() - start
+        before, after = migrated.vacuum()
+        stored = result_bytes(migrated, "SELECT SUM(length(result)) FROM analysis_results")
+        migrated.close()
+        print(f"  {'migrated + vacuum':<30} {after / 1e6:>8.1f} {stored / 1e6:>11.1f} {'':>9}"
+              f"  (migration {migration:.1f} s, {before / 1e6:.1f} MB before vacuum)")
+
+        fresh = DatabaseManager(os.path.join(workdir, "fresh.db"))
+        elapsed = write_all(fresh, DatabaseManager.save_analysis_results)
+        size = fresh.vacuum()[1]
+        stored = result_bytes(fresh, "SELECT SUM(length(result)) FROM analysis_results")
+        with fresh._connection() as conn:
+            distinct = conn.execute("SELECT COUNT(*) FROM analysis_results").fetchone()[0]
+        fresh.close()
+        print(f"  {'content-addressed, zlib':<30} {size / 1e6:>8.1f} {stored / 1e6:>11.1f} {args.rows / elapsed:>9.0f}"
+              f"  ({distinct} distinct results)")
+
+
+def bench_history_writer(args):
+    """Caller-side latency of persisting analysis history: synchronous save vs write-behind queue"""
+    from database import DatabaseManager, AnalysisHistoryWriter
+
+    result = {"interactions": [], "risk_level": "LOW", **SAMPLE_REQUEST}
+    record = (SAMPLE_REQUEST["doctorA_medicines"], SAMPLE_REQUEST["doctorB_medicines"], 0, "LOW", result)
+
+    print(f"{args.requests} history saves per configuration")
+    for profile in ("default", "performance"):
+        with tempfile.TemporaryDirectory() as workdir:
+            db = DatabaseManager(os.path.join(workdir, "bench.db"), profile=profile)
+            user_id = db.get_user_by_email("demo@example.com")["id"]
+
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                db.save_analysis_result(user_id, *record)
+            report(f"{profile}: synchronous", args.requests, time.perf_counter() - start, unit="save")
+
+            writer = AnalysisHistoryWriter(db)
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                writer.submit(user_id, *record)
+            report(f"{profile}: write-behind", args.requests, time.perf_counter() - start, unit="save")
+            drain_start = time.perf_counter()
+            writer.close()
+            print(f"  {'':<28} drained in {(time.perf_counter() - drain_start) * 1000:.1f} ms, "
+                  f"{db.get_user_stats(user_id)['total_analyses']} rows stored")
+            db.close()
+
+
+def bench_password_hashing(args):
+    """/check-conflicts latency while a login storm runs: bcrypt inline on request threads vs the PasswordHasher pool"""
+    from database import PasswordHasher
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        import api
+        prescriptions = random_prescriptions(20000, 5)
+        credentials = {"email": "demo@example.com", "password": "demo123"}
+        # Store the demo hash at the benchmark cost so logins don't trigger rehashing
+        api.db.password_hasher.close()
+        api.db.password_hasher = PasswordHasher(rounds=args.bcrypt_rounds)
+        assert app_module.app.test_client().post("/auth/login", json=credentials).status_code == 200
+
+        scenarios = [
+            ("analysis only", None),
+            # One hashing thread per login request thread: what inline bcrypt did
+            ("logins, bcrypt inline", PasswordHasher(args.bcrypt_rounds, workers=args.logins,
+                                                     max_pending=args.logins, niceness=0)),
+            ("logins, bounded pool", PasswordHasher(args.bcrypt_rounds)),
+        ]
+        print(f"/check-conflicts from 1 client for {args.duration}s, {args.logins} clients looping /auth/login "
+              f"(bcrypt cost {args.bcrypt_rounds}, {os.cpu_count()} CPUs)")
+        print(f"  {'':<24} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'analyses/s':>11} {'logins/s':>9}")
+        for label, hasher in scenarios:
+            api.conflict_checker._result_cache.clear()
+            if hasher is not None:
+                api.db.password_hasher.close()
+                api.db.password_hasher = hasher
+            latencies = []
+            logins = [0]
+            stop = threading.Event()
+
+            def analyst():
+                client = app_module.app.test_client()
+                index = 0
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    client.post("/check-conflicts", json=prescriptions[index % len(prescriptions)])
+                    latencies.append(time.perf_counter() - start)
+                    index += 1
+
+            def login_client():
+                client = app_module.app.test_client()
+                while not stop.is_set():
+                    if client.post("/auth/login", json=credentials).status_code == 200:
+                        logins[0] += 1
+
+            threads = [threading.Thread(target=analyst)]
+            if hasher is not None:
+                threads += [threading.Thread(target=login_client) for _ in range(args.logins)]
+            for thread in threads:
+                thread.start()
+            time.sleep(args.duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+            latencies.sort()
+            p50, p99 = (latencies[int(len(latencies) * q)] * 1000 for q in (0.5, 0.99))
+            print(f"  {label:<24} {p50:>8.2f} {p99:>8.2f} {latencies[-1] * 1000:>8.2f} "
+                  f"{len(latencies) / args.duration:>11.1f} {logins[0] / args.duration:>9.1f}")
+
+
+def bench_static_responses(args):
+    """GET /medicines and /conflicts/<medicine>: serialize per request vs precomputed body, gzip and 304"""
+    import json
+    import random
+    from flask import jsonify
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        import api
+        checker = api.conflict_checker
+        checker.import_database(json.dumps(synthetic_database(args.drugs, 10)))
+        known = checker.get_all_known_medicines()
+        rng = random.Random(3)
+
+        # The handlers as they were: jsonify the knowledge base on every request
+        def medicines_uncached():
+            medicines = checker.get_all_known_medicines()
+            return jsonify({"medicines": medicines, "count": len(medicines)})
+
+        def conflicts_uncached(medicine):
+            return jsonify({"medicine": medicine, "conflicts": checker.get_medicine_conflicts(medicine)})
+
+        app_module.app.add_url_rule("/bench/medicines", view_func=medicines_uncached)
+        app_module.app.add_url_rule("/bench/conflicts/<medicine>", view_func=conflicts_uncached)
+        client = app_module.app.test_client()
+        etags = {path: client.get(path).headers["ETag"] for path in ("/medicines", f"/conflicts/{known[0]}")}
+
+        print(f"synthetic {args.drugs}-drug database, {args.requests} requests per row "
+              f"(/medicines body {len(client.get('/medicines').data)} bytes, "
+              f"{len(client.get('/medicines', headers={'Accept-Encoding': 'gzip'}).data)} gzipped)")
+        for label, make_path, headers in (
+            ("/medicines serialized", lambda: "/bench/medicines", {}),
+            ("/medicines precomputed", lambda: "/medicines", {}),
+            ("/medicines gzip", lambda: "/medicines", {"Accept-Encoding": "gzip"}),
+            ("/medicines 304", lambda: "/medicines", {"If-None-Match": etags["/medicines"]}),
+            ("/conflicts serialized", lambda: f"/bench/conflicts/{rng.choice(known)}", {}),
+            ("/conflicts precomputed", lambda: f"/conflicts/{rng.choice(known)}", {}),
+            ("/conflicts 304", lambda: f"/conflicts/{known[0]}", {"If-None-Match": etags[f"/conflicts/{known[0]}"]}),
+        ):
+            paths = [make_path() for _ in range(args.requests)]
+            for path in set(paths):  # precompute every body once, as steady-state traffic would
+                client.get(path, headers=headers)
+            start = time.perf_counter()
+            for path in paths:
+                client.get(path, headers=headers)
+            report(label, args.requests, time.perf_counter() - start)
+
+
+def random_prescriptions(count: int, medicines_per_doctor: int, seed: int = 7):
+    """Synthetic prescription sets drawn from the known medicines"""
+    import random
+    from conflict_checker import ConflictChecker
+
+    rng = random.Random(seed)
+    known = ConflictChecker().get_all_known_medicines()
+    size = min(medicines_per_doctor, len(known))
+    return [
+        {"doctorA_medicines": rng.sample(known, size), "doctorB_medicines": rng.sample(known, size),
+         "user_allergies": rng.sample(["penicillin", "nsaid", "sulfa", "aspirin", "macrolide"], 2)}
+        for _ in range(count)
+    ]
+
+
+def synthetic_database(drugs: int, conflicts_per_drug: int, seed: int = 11) -> Dict[str, dict]:
+    """conflict_database-shaped dict with random interactions drawn from a small reason vocabulary"""
+    import random
+
+    rng = random.Random(seed)
+    names = [f"drug{i:06d}" for i in range(drugs)]
+    reasons = [f"Synthetic interaction class {i} may increase bleeding risk." for i in range(200)]
+    allergies = [f"class{i}" for i in range(500)]
+    return {
+        name: {
+            "conflicts": [{"drug": other, "reason": rng.choice(reasons)}
+                          for other in rng.sample(names, min(conflicts_per_drug, drugs))],
+            "allergy_conflicts": [{"allergy": rng.choice(allergies), "reason": rng.choice(reasons)}]
+        }
+        for name in names
+    }
+
+
+def bench_numpy_engine(args):
+    """Batch interaction screening: pure-Python engines vs the vectorized NumPy engine"""
+    import json
+    import random
+    from conflict_checker import ConflictChecker
+
+    for label, database in (("bundled database", None), ("synthetic 2,000 drugs", synthetic_database(2000, 10))):
+        checker = ConflictChecker(result_cache_size=0)
+        if database is not None:
+            checker.import_database(json.dumps(database))
+        known = checker.get_all_known_medicines()
+        rng = random.Random(3)
+        medicine_lists = [rng.sample(known, min(20, len(known))) for _ in range(args.requests)]
+        prescriptions = [(medicines[:10], medicines[10:], []) for medicines in medicine_lists]
+
+        print(f"{label}: {args.requests} prescriptions x 20 medicines")
+        for engine in ("pairwise", "adjacency"):
+            start = time.perf_counter()
+            expected = [checker._find_interactions_with_engine(medicines, engine) for medicines in medicine_lists]
+            report(f"{engine} (interactions)", args.requests, time.perf_counter() - start, unit="rx")
+
+        start = time.perf_counter()
+        found = checker._find_drug_interactions_numpy_batch(medicine_lists)
+        report("numpy batch (interactions)", args.requests, time.perf_counter() - start, unit="rx")
+        assert found == expected, "numpy engine output differs"
+
+        for engine in ("adjacency", "numpy"):
+            start = time.perf_counter()
+            for _ in checker.analyze_batch(prescriptions, engine=engine):
+                pass
+            report(f"{engine} (analyze_batch)", args.requests, time.perf_counter() - start, unit="rx")
+
+
+def bench_engines(args):
+    """Single-request interaction lookup latency per engine at 5, 20 and 60 medicines"""
+    import json
+    import random
+    from conflict_checker import ConflictChecker, np
+
+    checker = ConflictChecker(result_cache_size=0)
+    checker.import_database(json.dumps(synthetic_database(args.drugs, 10)))
+    engines = [engine for engine in checker.INTERACTION_ENGINES if engine != "numpy" or np is not None]
+    known = checker.get_all_known_medicines()
+    rng = random.Random(5)
+
+    print(f"synthetic {args.drugs}-drug database, {args.requests} lookups per cell (microseconds/lookup)")
+    print(f"  {'medicines':<12}" + "".join(f"{engine:>12}" for engine in engines))
+    for size in (5, 20, 60):
+        samples = [rng.sample(known, size) for _ in range(args.requests)]
+        cells = []
+        for engine in engines:
+            checker._find_interactions_with_engine(samples[0], engine)  # build lazy indexes
+            start = time.perf_counter()
+            for medicines in samples:
+                checker._find_interactions_with_engine(medicines, engine)
+            cells.append((time.perf_counter() - start) * 1e6 / args.requests)
+        print(f"  {size:<12}" + "".join(f"{cell:>12.2f}" for cell in cells))
+
+
+def bench_batch(args):
+    """Analyses/sec through /check-conflicts one at a time vs /check-conflicts/batch"""
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        import api
+        client = app_module.app.test_client()
+        prescriptions = random_prescriptions(args.requests, 5)
+
+        print(f"{args.requests} prescription sets (result cache cleared before each run)")
+        api.conflict_checker._result_cache.clear()
+        start = time.perf_counter()
+        for prescription in prescriptions:
+            client.post("/check-conflicts", json=prescription)
+        report("individual requests", args.requests, time.perf_counter() - start, unit="analysis")
+
+        api.conflict_checker._result_cache.clear()
+        start = time.perf_counter()
+        response = client.post("/check-conflicts/batch", json=prescriptions)
+        assert len(response.data.splitlines()) == args.requests + 1
+        report("single batch request", args.requests, time.perf_counter() - start, unit="analysis")
+
+
+def bench_multiprocess(args):
+    """Records/sec of the offline batch CLI for increasing process-pool sizes"""
+    import json
+    from conflict_checker import run_batch_file
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= max(os.cpu_count() or 1, 2):
+        worker_counts.append(worker_counts[-1] * 2)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_path = os.path.join(workdir, "prescriptions.ndjson")
+        with open(input_path, "w") as sink:
+            for prescription in random_prescriptions(args.requests, 10):
+                sink.write(json.dumps(prescription) + "\n")
+
+        print(f"{args.requests} prescription sets, {os.cpu_count()} CPUs available")
+        for workers in worker_counts:
+            start = time.perf_counter()
+            run_batch_file(input_path, os.path.join(workdir, f"results-{workers}.ndjson"), workers=workers)
+            report(f"{workers} worker(s)", args.requests, time.perf_counter() - start, unit="record")
+
+
+def traced_allocation(build: Callable):
+    """(value, MB of traced allocations still held after build()); tracemalloc must be running"""
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    gc.collect()
+    return value, (tracemalloc.get_traced_memory()[0] - before) / 2**20
+
+
+def bench_records(args):
+    """tracemalloc: knowledge base entries and retained results as dicts vs slotted records"""
+    import json
+    import random
+    import tracemalloc
+    from conflict_checker import ConflictChecker
+    from knowledge_base import KnowledgeBase
+    from records import medicine_entry
+
+    database = synthetic_database(args.drugs, 5)
+    text = json.dumps(database)
+    rng = random.Random(9)
+    known = list(database)
+
+    def regimen():
+        # Two drugs plus their declared partners, so every result carries interactions
+        first, second = rng.sample(known, 2)
+        medicines = [first, second] + [conflict["drug"] for conflict in database[first]["conflicts"] + database[second]["conflicts"]]
+        allergies = [database[first]["allergy_conflicts"][0]["allergy"], f"class{rng.randrange(500)}"]
+        return medicines[::2], medicines[1::2], allergies
+
+    regimens = [regimen() for _ in range(200)]
+    del database
+    requests = [rng.choice(regimens) for _ in range(args.requests)]
+
+    def record_entries():
+        reasons = {}
+        return {medicine: medicine_entry(medicine_data, reasons) for medicine, medicine_data in json.loads(text).items()}
+
+    tracemalloc.start()
+    print(f"synthetic {args.drugs}-drug database (5 conflicts each); MB held, measured with tracemalloc")
+    entries, size = traced_allocation(lambda: json.loads(text))
+    print(f"  {'entries as dicts':<36} {size:>8.1f}")
+    del entries
+    entries, size = traced_allocation(record_entries)
+    print(f"  {'entries as records + reason pool':<36} {size:>8.1f}")
+    del entries
+    kb, size = traced_allocation(lambda: KnowledgeBase(json.loads(text)))
+    print(f"  {'KnowledgeBase (records + indexes)':<36} {size:>8.1f}")
+    del kb
+
+    checker = ConflictChecker()
+    checker.import_database(text)
+    results, size = traced_allocation(lambda: [checker.analyze_prescriptions(*request) for request in requests])
+    print(f"{args.requests} retained results over {len(regimens)} distinct regimens (result cache on)")
+    print(f"  {'shared records':<36} {size:>8.1f}")
+    # What the dict-based entries cost: a fresh dict per entry per caller
+    _, size = traced_allocation(lambda: [
+        {**result, "interactions": [interaction.to_dict() for interaction in result["interactions"]],
+         "allergy_conflicts": [conflict.to_dict() for conflict in result["allergy_conflicts"]]}
+        for result in results])
+    print(f"  {'per-caller dict copies':<36} {size:>8.1f}")
+    tracemalloc.stop()
+
+
+def synthetic_names(count: int, seed: int = 13) -> list:
+    """Distinct pronounceable drug-like names (5-14 letters)"""
+    import random
+
+    rng = random.Random(seed)
+    syllables = ["ab", "al", "am", "an", "ar", "ce", "cil", "da", "de", "di", "dol", "fen", "for", "gli", "in", "la",
+                 "le", "lin", "lo", "ma", "met", "mi", "mo", "na", "ne", "no", "ol", "om", "pa", "pra", "pro", "ra",
+                 "ri", "ro", "sa", "se", "si", "ta", "te", "ti", "tra", "va", "vi", "xa", "zi", "zo"]
+    suffixes = ["", "ine", "ol", "an", "ide", "one", "pril", "vir", "mab", "zole", "cin", "tan"]
+    names = set()
+    while len(names) < count:
+        name = "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) + rng.choice(suffixes)
+        if 5 <= len(name) <= 14:
+            names.add(name)
+    return sorted(names)
+
+
+def bench_name_resolution(args):
+    """Medicine name resolution latency (exact, alias, 1-2 typos, unknown) over a large name index"""
+    import random
+    from name_resolver import NameResolver
+
+    names = synthetic_names(args.names)
+    rng = random.Random(17)
+    aliases = {f"brand{i}": rng.choice(names) for i in range(args.names // 10)}
+
+    def typo(name: str, edits: int) -> str:
+        for _ in range(edits):
+            position = rng.randrange(len(name))
+            name = name[:position] + rng.choice("aeioulnrst") + name[position + 1:]
+        return name
+
+    start = time.perf_counter()
+    NameResolver(names, aliases)
+    print(f"{args.names} names + {len(aliases)} aliases: index built in {time.perf_counter() - start:.2f}s")
+
+    samples = [rng.choice(names) for _ in range(args.requests)]
+    queries = {
+        "exact": samples,
+        "alias": [rng.choice(list(aliases)) for _ in samples],
+        "1 typo": [typo(name, 1) for name in samples],
+        "2 typos (8+ letters)": [typo(name, 2) for name in samples if len(name) >= 8],
+        "unknown": ["qx" + typo(name, 3) for name in samples],
+    }
+    for cache_size, label in ((0, "uncached"), (8192, "cached")):
+        resolver = NameResolver(names, aliases, cache_size=cache_size)
+        print(f"  {label}")
+        for kind, batch in queries.items():
+            for name in batch:  # warm the cache (no-op when uncached)
+                resolver.resolve(name)
+            start = time.perf_counter()
+            for name in batch:
+                resolver.resolve(name)
+            report(kind, len(batch), time.perf_counter() - start, unit="lookup")
+
+
+def uvicorn_worker_class() -> str:
+    """Gunicorn worker class for ASGI apps: the uvicorn-worker package, else uvicorn's bundled one"""
+    import importlib.util
+    return "uvicorn_worker.UvicornWorker" if importlib.util.find_spec("uvicorn_worker") else "uvicorn.workers.UvicornWorker"
+
+
+# label -> (modules the server needs, command line for (port, workers))
+SERVERS: Dict[str, tuple] = {
+    # What `python app.py` runs (minus the reloader, so the benchmark can stop it)
+    "dev server": ((), lambda port, workers: [
+        sys.executable, "-c",
+        f"import app; app.app.run(host='127.0.0.1', port={port}, debug=True, threaded=True, use_reloader=False)"]),
+    "gunicorn (WSGI)": (("gunicorn",), lambda port, workers: [
+        sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+        "-b", f"127.0.0.1:{port}", "-w", str(workers), "app:app"]),
+    "uvicorn (ASGI)": (("gunicorn", "uvicorn"), lambda port, workers: [
+        sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+        "-b", f"127.0.0.1:{port}", "-w", str(workers), "-k", uvicorn_worker_class(), "asgi:app"]),
+}
+
+
+def bench_serving(args):
+    """/check-conflicts throughput and tail latency over real HTTP: dev server vs gunicorn vs uvicorn"""
+    import http.client
+    import importlib.util
+    import json
+    import socket
+    import subprocess
+
+    prescriptions = [json.dumps(p).encode() for p in random_prescriptions(5000, 5)]
+    print(f"{args.clients} keep-alive clients for {args.duration}s per server, {args.workers} workers "
+          f"where supported ({os.cpu_count()} CPUs)")
+    print(f"  {'':<18} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for label, (modules, command) in SERVERS.items():
+        missing = [module for module in modules if importlib.util.find_spec(module) is None]
+        if missing:
+            print(f"  {label:<18} skipped ({', '.join(missing)} not installed)")
+            continue
+
+        with tempfile.TemporaryDirectory() as workdir:
+            shutil.copy(os.path.join(BACKEND_DIR, "prescription_checker.db"), workdir)
+            with socket.socket() as probe:
+                probe.bind(("127.0.0.1", 0))
+                port = probe.getsockname()[1]
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+                       SPARD_LOG_LEVEL="WARNING", SPARD_KNOWLEDGE_BASE_POLL="0")
+            server = subprocess.Popen(command(port, args.workers), cwd=workdir, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                deadline = time.monotonic() + 30
+                while True:
+                    try:
+                        probe = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                        probe.request("GET", "/")
+                        probe.getresponse().read()
+                        probe.close()
+                        break
+                    except OSError:
+                        if time.monotonic() > deadline or server.poll() is not None:
+                            raise RuntimeError(f"{label} did not start")
+                        time.sleep(0.2)
+
+                latencies = []
+                errors = [0]
+                stop = threading.Event()
+
+                def client(offset: int):
+                    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                    index = offset
+                    while not stop.is_set():
+                        body = prescriptions[index % len(prescriptions)]
+                        index += args.clients
+                        start = time.perf_counter()
+                        try:
+                            connection.request("POST", "/check-conflicts", body,
+                                               {"Content-Type": "application/json"})
+                            response = connection.getresponse()
+                            response.read()
+                            if response.status != 200:
+                                errors[0] += 1
+                                continue
+                        except (OSError, http.client.HTTPException):
+                            errors[0] += 1
+                            connection.close()
+                            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                            continue
+                        latencies.append(time.perf_counter() - start)
+                    connection.close()
+
+                threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+                for thread in threads:
+                    thread.start()
+                time.sleep(args.duration)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+            latencies.sort()
+            p50, p99 = (latencies[int(len(latencies) * q)] * 1000 for q in (0.5, 0.99))
+            print(f"  {label:<18} {len(latencies) / args.duration:>9.1f} {p50:>8.2f} {p99:>8.2f} {errors[0]:>7}")
+
+
+KB_MEMORY_WORKER = """
+import random, sys
+sys.path.insert(0, sys.argv[1])
+from knowledge_base import load_knowledge_base
+if sys.argv[2] != "-":
+    kb = load_knowledge_base(sys.argv[2])
+    known = list(kb.medicines)
+    rng = random.Random(int(sys.argv[3]))
+    for _ in range(2000):
+        kb.find_interactions(rng.sample(known, 20), "adjacency")
+print("ready", flush=True)
+sys.stdin.read()
+"""
+
+
+def smaps_rollup(pid: int) -> Dict[str, int]:
+    """Rss/Pss/Private_* totals in kB for a running process (Linux)"""
+    totals = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                totals[parts[0].rstrip(":")] = int(parts[1])
+    return totals
+
+
+def bench_kb_memory(args):
+    """Per-worker memory for N processes loading the JSON knowledge base vs sharing the compiled mmap file"""
+    import json
+    import subprocess
+    from knowledge_base import KnowledgeBase, compile_knowledge_base
+
+    with tempfile.TemporaryDirectory() as workdir:
+        json_path = os.path.join(workdir, "conflict_database.json")
+        compiled_path = os.path.join(workdir, "conflict_database.spkb")
+        database = synthetic_database(args.drugs, 25)
+        with open(json_path, "w") as sink:
+            json.dump({"version": 1, "medicines": database}, sink)
+        compile_knowledge_base(KnowledgeBase(database, 1), compiled_path)
+        del database
+
+        print(f"synthetic {args.drugs}-drug database: JSON {os.path.getsize(json_path) / 2**20:.1f} MB, "
+              f"compiled {os.path.getsize(compiled_path) / 2**20:.1f} MB; {args.workers} workers (MB per worker)")
+        print(f"  {'':<22}{'RSS':>10}{'PSS':>10}{'private':>10}")
+        for label, path in (("interpreter only", "-"), ("JSON (dict indexes)", json_path), ("compiled (mmap)", compiled_path)):
+            workers = [subprocess.Popen([sys.executable, "-c", KB_MEMORY_WORKER, BACKEND_DIR, path, str(seed)],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                       for seed in range(args.workers)]
+            for worker in workers:
+                worker.stdout.readline()
+            usage = [smaps_rollup(worker.pid) for worker in workers]
+            for worker in workers:
+                worker.stdin.close()
+                worker.wait()
+
+            rss, pss, private = (sum(totals.get(key, 0) for totals in usage) / len(usage) / 1024
+                                 for key in ("Rss", "Pss", "Private_Dirty"))
+            print(f"  {label:<22}{rss:>10.1f}{pss:>10.1f}{private:>10.1f}")
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "logging": bench_logging,
+    "db-pool": bench_db_pool,
+    "db-profile": bench_db_profile,
+    "db-indexes": bench_db_indexes,
+    "history-writer": bench_history_writer,
+    "history-pages": bench_history_pages,
+    "result-store": bench_result_store,
+    "batch": bench_batch,
+    "multiprocess": bench_multiprocess,
+    "numpy-engine": bench_numpy_engine,
+    "engines": bench_engines,
+    "kb-memory": bench_kb_memory,
+    "records": bench_records,
+    "name-resolution": bench_name_resolution,
+    "password-hashing": bench_password_hashing,
+    "serving": bench_serving,
+    "static-responses": bench_static_responses,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per measurement")
+    parser.add_argument("--readers", type=int, default=6, help="Concurrent reader threads")
+    parser.add_argument("--writers", type=int, default=2, help="Concurrent writer threads")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per timed run")
+    parser.add_argument("--rows", type=int, default=1000000, help="Seeded analysis_history rows")
+    parser.add_argument("--users", type=int, default=1000, help="Seeded users")
+    parser.add_argument("--regimens", type=int, default=5000, help="Distinct prescription regimens in the result-store benchmark")
+    parser.add_argument("--drugs", type=int, default=2000, help="Drugs in synthetic databases")
+    parser.add_argument("--names", type=int, default=100000, help="Names in the name resolution index")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes in process-level benchmarks")
+    parser.add_argument("--queries", type=int, default=20, help="Calls per query in seeded benchmarks")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent HTTP clients in the serving benchmark")
+    parser.add_argument("--logins", type=int, default=8, help="Concurrent login clients")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="bcrypt cost in password benchmarks")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,255 +4,218 @@ Analyzes drug-drug interactions and allergy conflicts between prescriptions
 """
 
 import json
-from typing import List, Dict, Any, Optional, Tuple
+import logging
+import os
+import signal
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
+
+from cache import LRUCache
+from knowledge_base import DEFAULT_KNOWLEDGE_BASE_PATH, KnowledgeBase, load_knowledge_base, np, parse_knowledge_base
+from records import AllergyConflict, Interaction, MedicineEntry, NameResolution, json_default
+
+logger = logging.getLogger(__name__)
+
+def parse_prescription(data: dict) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Validate and normalize one prescription set from a request payload
+    
+    Returns:
+        (doctor_a_medicines, doctor_b_medicines, user_allergies)
+    
+    Raises:
+        ValueError: with a client-facing message when the payload is invalid
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Prescription set must be a JSON object")
+    
+    # Extract medicine lists and user allergies
+    doctor_a_medicines = data.get('doctorA_medicines', [])
+    doctor_b_medicines = data.get('doctorB_medicines', [])
+    user_allergies = data.get('user_allergies', [])
+    
+    # Validate input
+    if not isinstance(doctor_a_medicines, list) or not isinstance(doctor_b_medicines, list):
+        raise ValueError("Medicine lists must be arrays")
+    
+    if not isinstance(user_allergies, list):
+        raise ValueError("User allergies must be an array")
+    
+    if len(doctor_a_medicines) == 0 and len(doctor_b_medicines) == 0:
+        raise ValueError("At least one medicine list must contain medicines")
+    
+    if not all(isinstance(item, str) for item in doctor_a_medicines + doctor_b_medicines + user_allergies):
+        raise ValueError("Medicines and allergies must be strings")
+    
+    # Clean and normalize medicine names
+    doctor_a_medicines = [medicine.lower().strip() for medicine in doctor_a_medicines if medicine.strip()]
+    doctor_b_medicines = [medicine.lower().strip() for medicine in doctor_b_medicines if medicine.strip()]
+    user_allergies = [allergy.strip() for allergy in user_allergies if allergy.strip()]
+    
+    return doctor_a_medicines, doctor_b_medicines, user_allergies
 
 class ConflictChecker:
-    def __init__(self):
-        """Initialize the conflict checker with the complete conflict database"""
-        self.conflict_database = {
-            "lisinopril": {
-                "conflicts": [
-                    {"drug": "atenolol", "reason": "Combining ACE inhibitors with beta-blockers requires careful blood pressure monitoring."},
-                    {"drug": "ibuprofen", "reason": "Ibuprofen may reduce the blood pressure-lowering effect of Lisinopril."}
-                ],
-                "allergy_conflicts": [
-                    {"allergy": "ace_inhibitors", "reason": "Lisinopril is an ACE inhibitor and may trigger reactions."}
-                ]
-            },
-
-            "metformin": {
-                "conflicts": [
-                    {"drug": "ibuprofen", "reason": "Ibuprofen can destabilize blood sugar levels when combined with Metformin."}
-                ],
-                "allergy_conflicts": [
-                    {"allergy": "metformin", "reason": "You are allergic to Metformin. This diabetes medication should be avoided."},
-                    {"allergy": "biguanide", "reason": "Metformin is a biguanide medication and should be avoided by people with biguanide allergies."}
-                ]
-            },
-
-            "aspirin": {
-                "conflicts": [
-                    {"drug": "ibuprofen", "reason": "Taking both aspirin and ibuprofen together can increase stomach bleeding risk."}
-                ],
-                "allergy_conflicts": [
-                    {"allergy": "aspirin", "reason": "You are allergic to aspirin. Taking this medication can cause severe allergic reactions."},
-                    {"allergy": "salicylate", "reason": "Aspirin contains salicylates and should be avoided by people with salicylate allergies."},
-                    {"allergy": "nsaid", "reason": "Aspirin is an NSAID and should be avoided by people with NSAID allergies."}
-                ]
-            },
-
-            "ibuprofen": {
-                "conflicts": [
-                    {"drug": "metformin", "reason": "This combination can cause blood sugar fluctuations and stomach issues."},
-                    {"drug": "aspirin", "reason": "Both are NSAIDs and can increase stomach bleeding risk."}
-                ],
-                "allergy_conflicts": [
-                    {"allergy": "nsaid", "reason": "Ibuprofen is an NSAID and should be avoided by people with NSAID allergies."}
-                ]
-            },
-
-            "amoxicillin": {
-                "conflicts": [],
-                "allergy_conflicts": [
-                    {"allergy": "penicillin", "reason": "Amoxicillin belongs to the penicillin family and may cause severe allergic reactions."}
-                ]
-            },
-
-            "paracetamol": {
-                "conflicts": [
-                    {"drug": "alcohol", "reason": "This combination increases the risk of liver damage."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "aspirin": {
-                "conflicts": [
-                    {"drug": "ibuprofen", "reason": "Both are NSAIDs and may cause internal bleeding when taken together."},
-                    {"drug": "warfarin", "reason": "Aspirin enhances the blood-thinning effect of Warfarin, increasing bleeding risk."}
-                ],
-                "allergy_conflicts": [
-                    {"allergy": "salicylates", "reason": "Aspirin is a salicylate and may trigger allergic reactions."}
-                ]
-            },
-
-            "warfarin": {
-                "conflicts": [
-                    {"drug": "aspirin", "reason": "Both thin the blood and may cause severe bleeding."},
-                    {"drug": "ibuprofen", "reason": "NSAIDs can increase bleeding when combined with Warfarin."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "azithromycin": {
-                "conflicts": [
-                    {"drug": "antacids", "reason": "Antacids reduce the absorption of Azithromycin."}
-                ],
-                "allergy_conflicts": [
-                    {"allergy": "macrolide", "reason": "Azithromycin is a macrolide antibiotic and may cause allergic reactions."}
-                ]
-            },
-
-            "cetirizine": {
-                "conflicts": [
-                    {"drug": "alcohol", "reason": "Alcohol increases drowsiness when taken with Cetirizine."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "pantoprazole": {
-                "conflicts": [],
-                "allergy_conflicts": []
-            },
-
-            "omeprazole": {
-                "conflicts": [
-                    {"drug": "clopidogrel", "reason": "Omeprazole reduces the activation of Clopidogrel, lowering its effectiveness."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "clopidogrel": {
-                "conflicts": [
-                    {"drug": "omeprazole", "reason": "Omeprazole reduces how well Clopidogrel works."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "simvastatin": {
-                "conflicts": [
-                    {"drug": "warfarin", "reason": "Simvastatin can enhance the blood-thinning effect of Warfarin."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "amlodipine": {
-                "conflicts": [
-                    {"drug": "simvastatin", "reason": "High doses of Simvastatin with Amlodipine may cause muscle damage."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "simvastatin": {
-                "conflicts": [
-                    {"drug": "amlodipine", "reason": "Combination may increase risk of muscle breakdown."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "levocetirizine": {
-                "conflicts": [
-                    {"drug": "alcohol", "reason": "Increases drowsiness and dizziness."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "montelukast": {
-                "conflicts": [],
-                "allergy_conflicts": []
-            },
-
-            "diclofenac": {
-                "conflicts": [
-                    {"drug": "warfarin", "reason": "Increases risk of severe bleeding."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "sertraline": {
-                "conflicts": [
-                    {"drug": "tramadol", "reason": "May cause serotonin syndrome."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "tramadol": {
-                "conflicts": [
-                    {"drug": "sertraline", "reason": "May trigger serotonin syndrome, a life-threatening condition."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "metronidazole": {
-                "conflicts": [
-                    {"drug": "alcohol", "reason": "Causes severe vomiting and rapid heartbeat."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "acetaminophen": {
-                "conflicts": [
-                    {"drug": "alcohol", "reason": "Drastically increases risk of liver toxicity."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "cough_syrup": {
-                "conflicts": [
-                    {"drug": "paracetamol", "reason": "Many syrups contain paracetamol, increasing overdose risk."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "insulin": {
-                "conflicts": [
-                    {"drug": "beta_blockers", "reason": "Beta-blockers may hide symptoms of low blood sugar."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "atenolol": {
-                "conflicts": [
-                    {"drug": "insulin", "reason": "Masks signs of hypoglycemia."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "erythromycin": {
-                "conflicts": [
-                    {"drug": "statins", "reason": "May increase risk of muscle injury."}
-                ],
-                "allergy_conflicts": [
-                    {"allergy": "macrolide", "reason": "Erythromycin is a macrolide and may cause allergic reactions."}
-                ]
-            },
-
-            "statins": {
-                "conflicts": [
-                    {"drug": "erythromycin", "reason": "Increases statin concentration causing muscle damage."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "ceftriaxone": {
-                "conflicts": [],
-                "allergy_conflicts": [
-                    {"allergy": "cephalosporin", "reason": "Ceftriaxone is a cephalosporin and may cause reactions."}
-                ]
-            },
-
-            "doxycycline": {
-                "conflicts": [
-                    {"drug": "antacids", "reason": "Antacids reduce the absorption of Doxycycline."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "antacids": {
-                "conflicts": [
-                    {"drug": "doxycycline", "reason": "Reduces antibiotic absorption significantly."}
-                ],
-                "allergy_conflicts": []
-            },
-
-            "prednisolone": {
-                "conflicts": [
-                    {"drug": "ibuprofen", "reason": "Combination increases chances of stomach bleeding."}
-                ],
-                "allergy_conflicts": []
-            }
-        }
+    # Strategies for drug-drug interaction lookup; all produce identical output
+    INTERACTION_ENGINES = ("pairwise", "adjacency", "bitset", "numpy")
+    # Prescription sets the numpy engine screens per vectorized pass in analyze_batch
+    NUMPY_BATCH_SIZE = 4096
+
+    def __init__(self, interaction_engine: str = "bitset", result_cache_size: int = 4096,
+                 result_cache_bytes: int = 32 * 1024 * 1024, database_path: str = DEFAULT_KNOWLEDGE_BASE_PATH,
+                 resolve_names: bool = True):
+        """
+        Initialize the conflict checker from the knowledge base data file
+        
+        Args:
+            interaction_engine: Default drug-drug lookup strategy (see INTERACTION_ENGINES); bitset is
+                the fastest at 5, 20 and 60 medicines (benchmark.py engines)
+            result_cache_size: Memoized analyses kept (LRU); 0 disables memoization
+            result_cache_bytes: Approximate memory cap for memoized analyses
+            database_path: Versioned knowledge base JSON file (see data/conflict_database.json)
+            resolve_names: Map spelling variants, brand names and synonyms to known medicines before
+                analysis, and suggest the closest known name for typos
+        """
+        self._check_engine(interaction_engine)
+        self.interaction_engine = interaction_engine
+        self.resolve_names = resolve_names
+        self.database_path = database_path
+        self._result_cache = LRUCache(max_entries=result_cache_size, max_bytes=result_cache_bytes)
+        
+        # Every lookup goes through one KnowledgeBase snapshot; updates build a new
+        # snapshot and replace the reference, never mutate the one being read
+        self._kb: Optional[KnowledgeBase] = None
+        self._generation = 0
+        self._swap_lock = threading.RLock()
+        self._watch_stop: Optional[threading.Event] = None
+        self._seen_signature: Optional[tuple] = None
+        
+        self.reload_database()
+
+    def _install(self, kb: KnowledgeBase):
+        """Publish a fully built snapshot; requests already running keep the one they hold"""
+        if self.resolve_names:
+            # Build the typo index now rather than on the first unknown name a request sends
+            kb.name_resolver()
+        with self._swap_lock:
+            self._generation += 1
+            kb.generation = self._generation
+            self._kb = kb
+        
+        # Memoized analyses were computed against the old data (their keys carry the old generation)
+        self._result_cache.clear()
+
+    @staticmethod
+    def _file_signature(path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
 
-    def analyze_prescriptions(self, doctor_a_medicines: List[str], doctor_b_medicines: List[str], user_allergies: Optional[List[str]] = None) -> Dict[str, Any]:
+    def reload_database(self, path: Optional[str] = None) -> Any:
+        """
+        Re-read the knowledge base file and atomically swap in the new snapshot
+        
+        The indexes are built before the swap. If the file is missing or invalid the
+        error propagates and the current snapshot keeps serving.
+        
+        Args:
+            path: Load this file instead (and watch it from now on)
+        
+        Returns:
+            The data version declared by the file
+        """
+        if path is not None:
+            self.database_path = path
+        self._seen_signature = self._file_signature(self.database_path)
+        kb = load_knowledge_base(self.database_path)
+        self._install(kb)
+        logger.info("Loaded conflict knowledge base version %s (%d medicines) from %s",
+                    kb.version, len(kb.medicines), self.database_path)
+        return kb.version
+
+    def _reload_logged(self):
+        """reload_database for background triggers: failures are logged, not raised"""
+        try:
+            self.reload_database()
+        except (OSError, ValueError) as e:
+            logger.error("Knowledge base reload failed, keeping version %s: %s", self._kb.version, e)
+        except Exception:
+            # Never let a bad file end the watcher thread; the next change is tried again
+            logger.exception("Unexpected error reloading the knowledge base, keeping version %s", self._kb.version)
+
+    def watch_database(self, interval: float = 2.0):
+        """
+        Poll the knowledge base file from a daemon thread and hot-reload it when its
+        modification time or size changes
+        """
+        if self._watch_stop is not None:
+            return
+        stop = self._watch_stop = threading.Event()
+        
+        def watch():
+            while not stop.wait(interval):
+                if self._file_signature(self.database_path) != self._seen_signature:
+                    self._reload_logged()
+        
+        threading.Thread(target=watch, name="knowledge-base-watcher", daemon=True).start()
+
+    def stop_watching(self):
+        """Stop the watch_database thread"""
+        if self._watch_stop is not None:
+            self._watch_stop.set()
+            self._watch_stop = None
+
+    def install_reload_signal(self, signum: Optional[int] = None) -> bool:
+        """
+        Hot-reload the knowledge base when the process receives signum (default SIGHUP)
+        
+        Returns:
+            False where the signal is unavailable or this is not the main thread
+        """
+        signum = signum if signum is not None else getattr(signal, "SIGHUP", None)
+        if signum is None:
+            return False
+        
+        # Keep the handler short; the index build runs on its own thread
+        def handle(_signum, _frame):
+            threading.Thread(target=self._reload_logged, name="knowledge-base-reload", daemon=True).start()
+        
+        try:
+            signal.signal(signum, handle)
+        except ValueError:
+            return False
+        return True
+
+    @property
+    def knowledge_base(self) -> KnowledgeBase:
+        """The installed snapshot; read it once per request so its data and generation stay consistent"""
+        return self._kb
+
+    @property
+    def conflict_database(self) -> Dict[str, dict]:
+        """The current snapshot's {medicine: {"conflicts", "allergy_conflicts"}} data (read-only)"""
+        return self._kb.medicines
+
+    @property
+    def database_version(self) -> int:
+        """Version stamp of the installed snapshot, bumped on every reload, import or addition"""
+        return self._kb.generation
+
+    @property
+    def data_version(self) -> Any:
+        """Version declared by the knowledge base file (None for legacy imports)"""
+        return self._kb.version
+
+    @classmethod
+    def _check_engine(cls, engine: str):
+        if engine not in cls.INTERACTION_ENGINES:
+            raise ValueError(f"Unknown interaction engine: {engine}")
+        if engine == "numpy" and np is None:
+            raise ValueError("The numpy interaction engine requires NumPy (pip install numpy)")
+
+    def analyze_prescriptions(self, doctor_a_medicines: List[str], doctor_b_medicines: List[str], user_allergies: Optional[List[str]] = None,
+                              engine: Optional[str] = None) -> Dict[str, Any]:
         """
         Main method to analyze prescriptions from two doctors
         
@@ -260,26 +223,87 @@ class ConflictChecker:
             doctor_a_medicines: List of medicines from Doctor A
             doctor_b_medicines: List of medicines from Doctor B
             user_allergies: Optional list of user's known allergies
+            engine: Optional interaction engine override (see INTERACTION_ENGINES)
             
         Returns:
-            Complete analysis result in the specified format
+            Complete analysis result in the specified format; the medicine lists echo the
+            submitted names and name_resolutions explains every name that was mapped to a
+            known medicine, only suggested one (fuzzy) or not found
         """
+        kb = self._kb
         user_allergies = user_allergies or []
         
-        # Combine all medicines
-        all_medicines = list(set(doctor_a_medicines + doctor_b_medicines))
+        name_resolutions: List[NameResolution] = []
+        
+        # Combine all medicines, as analyzed; sorted so every process reports interactions
+        # in the same order and identical analyses store identical results
+        all_medicines = sorted(set(self._resolve_names(kb, doctor_a_medicines, name_resolutions)
+                                   + self._resolve_names(kb, doctor_b_medicines, name_resolutions)))
+        
+        return self._analyze(doctor_a_medicines, doctor_b_medicines, user_allergies, all_medicines, engine,
+                             kb=kb, name_resolutions=name_resolutions)
+
+    def _resolve_names(self, kb: KnowledgeBase, medicines: List[str], resolutions: List[NameResolution]) -> List[str]:
+        """
+        Map submitted names to known medicines, recording each one that was not already a known name
+        
+        Only exact spellings, normalized spellings and aliases are applied. A typo's closest
+        known name may be a different drug (lansoprazole / pantoprazole), so fuzzy matches
+        are recorded as suggestions and the name is analyzed as submitted.
+        """
+        if not self.resolve_names:
+            return medicines
+        
+        resolved = []
+        for medicine in medicines:
+            if medicine not in kb.medicines:
+                resolution = kb.name_resolver().resolve(medicine)
+                if resolution.match != "name":
+                    resolutions.append(resolution)
+                # Unknown names and fuzzy suggestions are still analyzed as given
+                if resolution.match in ("normalized", "alias"):
+                    medicine = resolution.medicine
+            resolved.append(medicine)
+        return resolved
+
+    def _analyze(self, doctor_a_medicines: List[str], doctor_b_medicines: List[str], user_allergies: List[str],
+                 all_medicines: List[str], engine: Optional[str],
+                 interactions: Optional[List[Interaction]] = None, kb: Optional[KnowledgeBase] = None,
+                 name_resolutions: Optional[List[NameResolution]] = None) -> Dict[str, Any]:
+        """Body of analyze_prescriptions; batch engines may pass interactions they already computed (and the snapshot used)"""
+        kb = kb or self._kb
+        allergy_spellings = self._normalize_allergies(user_allergies)
         
-        # Find drug-drug interactions
-        interactions = self._find_drug_interactions(all_medicines)
+        # The analysis is a pure function of the medicine set, the normalized allergy
+        # set and the knowledge base snapshot, so identical regimens share one computation
+        cache_key = (kb.generation, tuple(sorted(all_medicines)), tuple(sorted(allergy_spellings)))
+        cached = self._result_cache.get(cache_key)
         
-        # Find user allergy conflicts (only show if user has matching allergies)
-        user_allergy_conflicts = self._find_user_allergy_conflicts(all_medicines, user_allergies)
+        if cached is None:
+            # Find drug-drug interactions
+            if interactions is None:
+                engine = engine or self.interaction_engine
+                self._check_engine(engine)
+                interactions = kb.find_interactions(all_medicines, engine)
+            
+            # Find user allergy conflicts (only show if user has matching allergies)
+            allergy_matches = kb.match_user_allergies(all_medicines, allergy_spellings)
+            
+            # Calculate risk level
+            risk_level = self._calculate_risk_level(interactions, allergy_matches)
+            
+            # Generate message
+            message = self._generate_message(risk_level, interactions, allergy_matches)
+            
+            cached = (interactions, allergy_matches, risk_level, message)
+            self._result_cache.set(cache_key, cached, size=self._estimate_result_size(cache_key, cached))
         
-        # Calculate risk level
-        risk_level = self._calculate_risk_level(interactions, user_allergy_conflicts)
+        interactions, allergy_matches, risk_level, message = cached
         
-        # Generate message
-        message = self._generate_message(risk_level, interactions, user_allergy_conflicts)
+        # Interaction records are immutable and shared by every caller; only the list is
+        # per caller. Allergies are reported in the caller's own spelling.
+        interactions = list(interactions)
+        user_allergy_conflicts = self._build_allergy_conflicts(allergy_matches, allergy_spellings)
         
         # Return result in exact format specified
         return {
@@ -288,127 +312,91 @@ class ConflictChecker:
             "interactions": interactions,
             "allergy_conflicts": user_allergy_conflicts,  # Only show user allergy conflicts
             "user_allergies": user_allergies,
+            "name_resolutions": name_resolutions or [],
             "risk_level": risk_level,
             "message": message
         }
 
-    def _find_drug_interactions(self, medicines: List[str]) -> List[Dict[str, str]]:
-        """Find all drug-drug interactions among the medicines"""
-        interactions = []
-        
-        # Check each pair of medicines
-        for i, med1 in enumerate(medicines):
-            for j, med2 in enumerate(medicines):
-                if i >= j:  # Avoid duplicates and self-comparison
-                    continue
-                
-                # Check if med1 has conflicts with med2
-                if med1 in self.conflict_database:
-                    for conflict in self.conflict_database[med1]["conflicts"]:
-                        if conflict["drug"] == med2:
-                            interactions.append({
-                                "pair": f"{med1} + {med2}",
-                                "reason": conflict["reason"]
-                            })
-                
-                # Check if med2 has conflicts with med1 (to catch bidirectional conflicts)
-                if med2 in self.conflict_database:
-                    for conflict in self.conflict_database[med2]["conflicts"]:
-                        if conflict["drug"] == med1:
-                            # Check if we already added this interaction
-                            existing_pair = f"{med1} + {med2}"
-                            reverse_pair = f"{med2} + {med1}"
-                            
-                            if not any(interaction["pair"] in [existing_pair, reverse_pair] 
-                                     for interaction in interactions):
-                                interactions.append({
-                                    "pair": f"{med2} + {med1}",
-                                    "reason": conflict["reason"]
-                                })
-        
-        return interactions
-
-    def _find_user_allergy_conflicts(self, medicines: List[str], user_allergies: List[str]) -> List[Dict[str, str]]:
+    def analyze_batch(self, prescriptions: Iterable[Tuple[List[str], List[str], List[str]]],
+                      engine: Optional[str] = None) -> Iterator[Dict[str, Any]]:
         """
-        Find conflicts between prescribed medicines and user's known allergies
-        Only reports conflicts if the user's allergy matches the medicine's allergy profile in the dataset
+        Analyze many prescription sets, yielding results in input order
         
         Args:
-            medicines: List of prescribed medicines
-            user_allergies: List of user's known allergies
-            
-        Returns:
-            List of allergy conflicts found
+            prescriptions: (doctor_a_medicines, doctor_b_medicines, user_allergies) tuples
+            engine: Optional interaction engine override (see INTERACTION_ENGINES)
         """
-        conflicts = []
-        
-        print(f"DEBUG: Checking user allergies: {user_allergies}")
-        print(f"DEBUG: Against medicines: {medicines}")
-        
-        if not user_allergies:
-            print("DEBUG: No user allergies provided")
-            return conflicts
+        engine = engine or self.interaction_engine
+        if engine != "numpy":
+            for doctor_a_medicines, doctor_b_medicines, user_allergies in prescriptions:
+                yield self.analyze_prescriptions(doctor_a_medicines, doctor_b_medicines, user_allergies, engine=engine)
+            return
         
-        # Normalize user allergies for comparison
-        normalized_user_allergies = [allergy.lower().strip() for allergy in user_allergies]
-        print(f"DEBUG: Normalized user allergies: {normalized_user_allergies}")
-        
-        for medicine in medicines:
-            medicine_lower = medicine.lower().strip()
-            print(f"DEBUG: Checking medicine: {medicine_lower}")
+        # Vectorized: screen a whole chunk of prescriptions in one pass of matrix operations
+        self._check_engine(engine)
+        prescriptions = iter(prescriptions)
+        while True:
+            chunk = [prescription for _, prescription in zip(range(self.NUMPY_BATCH_SIZE), prescriptions)]
+            if not chunk:
+                return
             
-            # Check if medicine exists in our conflict database
-            if medicine_lower in self.conflict_database:
-                medicine_data = self.conflict_database[medicine_lower]
-                
-                # Get the allergy conflicts defined for this medicine in the dataset
-                dataset_allergies = medicine_data.get('allergy_conflicts', [])
-                print(f"DEBUG: Dataset allergies for {medicine_lower}: {dataset_allergies}")
-                
-                # Check if any of the user's allergies match the dataset allergies for this medicine
-                for dataset_allergy_info in dataset_allergies:
-                    dataset_allergy = dataset_allergy_info.get('allergy', '').lower().strip()
-                    print(f"DEBUG: Checking dataset allergy: {dataset_allergy}")
-                    
-                    # Check if user has this specific allergy - EXACT MATCH ONLY
-                    for user_allergy in user_allergies:
-                        user_allergy_lower = user_allergy.lower().strip()
-                        print(f"DEBUG: Comparing user allergy '{user_allergy_lower}' with dataset allergy '{dataset_allergy}'")
-                        
-                        # Exact match only - no partial matching
-                        if user_allergy_lower == dataset_allergy:
-                            print(f"DEBUG: MATCH FOUND! {user_allergy_lower} == {dataset_allergy}")
-                            conflicts.append({
-                                "medicine": medicine,
-                                "allergy": user_allergy,
-                                "reason": dataset_allergy_info.get('reason', f"You are allergic to {user_allergy}. The prescribed medicine {medicine} is contraindicated for this allergy."),
-                                "type": "user_allergy_dataset_match"
-                            })
-                            break  # Avoid duplicate conflicts for the same medicine
-                        else:
-                            print(f"DEBUG: No match: '{user_allergy_lower}' != '{dataset_allergy}'")
-            else:
-                print(f"DEBUG: Medicine {medicine_lower} not found in database")
-        
-        print(f"DEBUG: Final conflicts found: {conflicts}")
+            kb = self._kb
+            resolved = []
+            all_medicines = []
+            for doctor_a_medicines, doctor_b_medicines, user_allergies in chunk:
+                name_resolutions: List[NameResolution] = []
+                medicines = sorted(set(self._resolve_names(kb, doctor_a_medicines, name_resolutions)
+                                       + self._resolve_names(kb, doctor_b_medicines, name_resolutions)))
+                resolved.append((doctor_a_medicines, doctor_b_medicines, user_allergies or [], name_resolutions))
+                all_medicines.append(medicines)
+            
+            interactions = kb.find_interactions_numpy_batch(all_medicines, self.NUMPY_BATCH_SIZE)
+            for (doctor_a_medicines, doctor_b_medicines, user_allergies, name_resolutions), medicines, found in zip(resolved, all_medicines, interactions):
+                yield self._analyze(doctor_a_medicines, doctor_b_medicines, user_allergies, medicines, engine, found, kb, name_resolutions)
+
+    def _find_interactions_with_engine(self, medicines: List[str], engine: str) -> List[Interaction]:
+        """Interaction lookup with the requested engine against the current snapshot"""
+        self._check_engine(engine)
+        return self._kb.find_interactions(medicines, engine)
+
+    def _find_drug_interactions_numpy_batch(self, medicine_lists: List[List[str]]) -> List[List[Interaction]]:
+        """Vectorized interaction lookup for many prescriptions against the current snapshot"""
+        self._check_engine("numpy")
+        return self._kb.find_interactions_numpy_batch(medicine_lists, self.NUMPY_BATCH_SIZE)
+
+    @staticmethod
+    def _normalize_allergies(user_allergies: List[str]) -> Dict[str, str]:
+        """Map each normalized allergy to the first spelling the user gave for it"""
+        allergy_spellings: Dict[str, str] = {}
+        for user_allergy in user_allergies:
+            allergy_spellings.setdefault(user_allergy.lower().strip(), user_allergy)
+        return allergy_spellings
+
+    @staticmethod
+    def _build_allergy_conflicts(matches: List[Tuple[str, str, Optional[str]]], allergy_spellings: Dict[str, str]) -> List[AllergyConflict]:
+        """Turn allergy index matches into response entries using the user's spelling"""
+        conflicts = []
+        for medicine, allergy, reason in matches:
+            user_allergy = allergy_spellings[allergy]
+            conflicts.append(AllergyConflict(
+                medicine,
+                user_allergy,
+                reason if reason is not None else f"You are allergic to {user_allergy}. The prescribed medicine {medicine} is contraindicated for this allergy."
+            ))
         return conflicts
 
-    def _find_allergy_conflicts(self, medicines: List[str]) -> List[Dict[str, str]]:
-        """Find all allergy conflicts among the medicines"""
-        allergy_conflicts = []
-        
-        for medicine in medicines:
-            if medicine in self.conflict_database:
-                for allergy_conflict in self.conflict_database[medicine]["allergy_conflicts"]:
-                    allergy_conflicts.append({
-                        "medicine": medicine,
-                        "allergy": allergy_conflict["allergy"],
-                        "reason": allergy_conflict["reason"]
-                    })
-        
-        return allergy_conflicts
-
-    def _calculate_risk_level(self, interactions: List[Dict], allergy_conflicts: List[Dict]) -> str:
+    @staticmethod
+    def _estimate_result_size(cache_key: tuple, cached: tuple) -> int:
+        """Rough memory footprint of a memoized analysis, for the result cache's byte cap"""
+        interactions, allergy_matches, _, message = cached
+        size = 512 + len(message)
+        size += sum(64 + len(medicine) for medicine in cache_key[1]) + sum(64 + len(allergy) for allergy in cache_key[2])
+        # Reasons are shared with the knowledge base, so only the record and pair text count
+        size += sum(128 + len(interaction.pair) for interaction in interactions)
+        size += sum(128 + len(medicine) + len(allergy) for medicine, allergy, _ in allergy_matches)
+        return size
+
+    def _calculate_risk_level(self, interactions: List[Interaction], allergy_conflicts: List) -> str:
         """Calculate the overall risk level based on interactions and allergy conflicts"""
         total_conflicts = len(interactions) + len(allergy_conflicts)
         
@@ -425,7 +413,7 @@ class ConflictChecker:
             
             # Check interactions for high-risk keywords
             for interaction in interactions:
-                reason = interaction["reason"].lower()
+                reason = interaction.reason.lower()
                 if any(keyword in reason for keyword in high_risk_keywords):
                     return "HIGH"
             
@@ -437,7 +425,7 @@ class ConflictChecker:
         else:
             return "HIGH"
 
-    def _generate_message(self, risk_level: str, interactions: List[Dict], allergy_conflicts: List[Dict]) -> str:
+    def _generate_message(self, risk_level: str, interactions: List[Interaction], allergy_conflicts: List) -> str:
         """Generate appropriate message based on risk level and conflicts found"""
         if risk_level == "HIGH":
             if len(allergy_conflicts) > 0 and len(interactions) > 0:
@@ -460,32 +448,135 @@ class ConflictChecker:
         """Get list of all medicines in the conflict database"""
         return list(self.conflict_database.keys())
 
-    def get_medicine_conflicts(self, medicine: str) -> Optional[Dict]:
+    def get_medicine_conflicts(self, medicine: str) -> Optional[MedicineEntry]:
         """Get all conflicts for a specific medicine"""
         medicine = medicine.lower().strip()
         return self.conflict_database.get(medicine)
 
     def add_medicine_to_database(self, medicine: str, conflicts: List[Dict], allergy_conflicts: List[Dict]):
-        """Add a new medicine to the conflict database (for future expansion)"""
+        """Add a new medicine to the conflict database (for future expansion; not written back to the data file)"""
         medicine = medicine.lower().strip()
-        self.conflict_database[medicine] = {
-            "conflicts": conflicts,
-            "allergy_conflicts": allergy_conflicts
-        }
+        with self._swap_lock:
+            current = self._kb
+            medicines = dict(current.medicines)
+            medicines[medicine] = {
+                "conflicts": conflicts,
+                "allergy_conflicts": allergy_conflicts
+            }
+            self._install(KnowledgeBase(medicines, current.version, current.aliases))
 
     def export_database(self) -> str:
-        """Export the conflict database as JSON string"""
-        return json.dumps(self.conflict_database, indent=2)
+        """Export the conflict database as JSON string, in the versioned data file format"""
+        return json.dumps(self._kb.to_document(), indent=2, default=json_default)
 
     def import_database(self, json_data: str):
-        """Import conflict database from JSON string"""
+        """Import conflict database from JSON string (versioned format, or a legacy plain medicine mapping)"""
         try:
-            self.conflict_database = json.loads(json_data)
+            data = json.loads(json_data)
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON data: {e}")
+        version, medicines, aliases = parse_knowledge_base(data)
+        self._install(KnowledgeBase(medicines, version, aliases))
+
+# Offline batch screening across processes; each worker loads the conflict database once
+_worker_checker: Optional[ConflictChecker] = None
+
+def _init_batch_worker(engine: str, database_path: str):
+    global _worker_checker
+    _worker_checker = ConflictChecker(interaction_engine=engine, database_path=database_path)
+
+def _analyze_batch_lines(lines: List[Tuple[int, str]]) -> str:
+    """Analyze one shard of (line number, NDJSON line) pairs in a worker, returning NDJSON output"""
+    output = []
+    for index, line in lines:
+        try:
+            if not line.strip():
+                raise ValueError("Empty line")
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON: {e}")
+            doctor_a_medicines, doctor_b_medicines, user_allergies = parse_prescription(data)
+            record = {"index": index, "result": _worker_checker.analyze_prescriptions(doctor_a_medicines, doctor_b_medicines, user_allergies)}
+        except ValueError as e:
+            record = {"index": index, "error": str(e)}
+        output.append(json.dumps(record, default=json_default))
+    return "\n".join(output) + "\n" if output else ""
+
+def run_batch_file(input_path: str, output_path: str, workers: Optional[int] = None, shard_size: int = 2000,
+                   engine: str = "bitset", database_path: str = DEFAULT_KNOWLEDGE_BASE_PATH) -> int:
+    """
+    Screen an NDJSON file of prescription sets with a process pool
+    
+    Shards are streamed to the workers (at most two per worker in flight, so memory
+    stays bounded) and their output is written back in input order.
+    
+    Args:
+        input_path: One {"doctorA_medicines", "doctorB_medicines", "user_allergies"} object per line
+        output_path: One {"index": i, "result": ...} or {"index": i, "error": ...} object per input
+                     line, same order; i is the 0-based input line number and blank lines are errors
+        workers: Process count (defaults to the number of CPUs)
+        shard_size: Records per unit of work handed to a worker
+        engine: Interaction engine the workers use
+        database_path: Knowledge base data file the workers load
+    
+    Returns:
+        Number of input lines processed
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import islice
+    
+    workers = workers or os.cpu_count() or 1
+    processed = 0
+    
+    with open(input_path, "r", encoding="utf-8") as source, open(output_path, "w", encoding="utf-8") as sink, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(engine, database_path)) as executor:
+        # Every line gets an output record, so output line i always answers input line i
+        records = enumerate(source)
+        pending: deque = deque()
+        
+        while True:
+            while len(pending) < workers * 2:
+                shard = list(islice(records, shard_size))
+                if not shard:
+                    break
+                processed += len(shard)
+                pending.append(executor.submit(_analyze_batch_lines, shard))
+            
+            if not pending:
+                break
+            sink.write(pending.popleft().result())
+    
+    return processed
+
+def _batch_cli(argv: List[str]) -> int:
+    import argparse
+    import time
+    
+    parser = argparse.ArgumentParser(description="Screen an NDJSON file of prescription sets for conflicts")
+    parser.add_argument("input", help="NDJSON input, one prescription set per line")
+    parser.add_argument("output", help="NDJSON output, one result per input line")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--shard-size", type=int, default=2000, help="Records per worker task")
+    parser.add_argument("--engine", choices=ConflictChecker.INTERACTION_ENGINES, default="bitset")
+    parser.add_argument("--database", default=DEFAULT_KNOWLEDGE_BASE_PATH, help="Knowledge base data file")
+    args = parser.parse_args(argv)
+    
+    start = time.perf_counter()
+    count = run_batch_file(args.input, args.output, args.workers, args.shard_size, args.engine, args.database)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Screened {count} input lines in {elapsed:.2f}s ({count / elapsed:.0f}/s)")
+    return 0
 
 # Example usage and testing
 if __name__ == "__main__":
+    import sys
+    
+    # Batch mode: python conflict_checker.py input.ndjson output.ndjson [--workers N]
+    if len(sys.argv) > 1:
+        sys.exit(_batch_cli(sys.argv[1:]))
+    
     # Initialize the conflict checker
     checker = ConflictChecker()
     
@@ -534,5 +625,20 @@ if __name__ == "__main__":
         
         print()
     
+    # Every interaction engine must agree with the reference pairwise scan
+    import random
+    
+    engines = [engine for engine in checker.INTERACTION_ENGINES if engine != "numpy" or np is not None]
+    known_medicines = checker.get_all_known_medicines() + ["unknown-drug"]
+    samples = [random.sample(known_medicines, random.randint(0, len(known_medicines))) for _ in range(500)]
+    for sample in samples:
+        expected = checker._find_interactions_with_engine(sample, "pairwise")
+        for engine in engines:
+            assert checker._find_interactions_with_engine(sample, engine) == expected, f"{engine} engine mismatch for {sample}"
+    if np is not None:
+        expected = [checker._find_interactions_with_engine(sample, "pairwise") for sample in samples]
+        assert checker._find_drug_interactions_numpy_batch(samples) == expected, "numpy batch mismatch"
+    print(f"🔁 Interaction engines agree: {', '.join(engines)}")
+    
     print("✅ All test cases completed!")
     print(f"📊 Total medicines in database: {len(checker.get_all_known_medicines())}")
\ No newline at end of file
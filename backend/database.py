@@ -3,22 +3,461 @@ Database management for Prescription Conflict Checker
 Handles user authentication and session management using SQLite
 """
 
+import base64
+import hashlib
 import sqlite3
 import bcrypt
+import json
+import logging
 import os
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 import uuid
+import zlib
+
+from cache import LRUCache
+from records import json_default
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA settings applied to every new connection, selectable per DatabaseManager
+PRAGMA_PROFILES: Dict[str, Dict[str, Any]] = {
+    # SQLite defaults: rollback journal, writers block readers
+    "default": {},
+    # WAL lets readers proceed while save_analysis_result writes
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # negative = KiB, i.e. 64 MiB
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY"
+    }
+}
+
+# Rebuild per-user summary counters from analysis_history (migration backfill and reconcile_user_stats)
+USER_STATS_REBUILD: List[str] = [
+    "DELETE FROM user_stats",
+    "DELETE FROM user_daily_stats",
+    """
+    INSERT INTO user_stats (user_id, total_analyses, high_risk_analyses)
+    SELECT user_id, COUNT(*), SUM(risk_level = 'HIGH')
+    FROM analysis_history
+    GROUP BY user_id
+    """,
+    """
+    INSERT INTO user_daily_stats (user_id, day, analyses)
+    SELECT user_id, date(created_at), COUNT(*)
+    FROM analysis_history
+    GROUP BY user_id, date(created_at)
+    """
+]
+
+# zlib level for stored analysis results: 6 is within a few percent of 9 at a fraction of the CPU
+RESULT_COMPRESSION_LEVEL = 6
+
+
+def result_digest(result_json: str) -> bytes:
+    """Content address of a serialized analysis result (SHA-256, raw bytes)"""
+    return hashlib.sha256(result_json.encode('utf-8')).digest()
+
+
+def compress_result(result_json: str) -> bytes:
+    """Stored form of a serialized analysis result"""
+    return zlib.compress(result_json.encode('utf-8'), RESULT_COMPRESSION_LEVEL)
+
+
+def decompress_result(blob: bytes) -> Any:
+    """Parsed analysis result from its stored form"""
+    return json.loads(zlib.decompress(blob))
+
+
+# Ordered schema migrations applied on startup; PRAGMA user_version records how many have run.
+# Append new entries only - never edit or reorder ones that have shipped.
+SCHEMA_MIGRATIONS: List[Tuple[str, List[str]]] = [
+    ("Index history, stats and session lookups", [
+        # get_user_analysis_history: WHERE user_id = ? ORDER BY created_at DESC
+        # get_user_stats: recent-activity count filters on the same columns
+        "CREATE INDEX IF NOT EXISTS idx_analysis_history_user_created ON analysis_history (user_id, created_at DESC)",
+        # get_user_stats: high risk count
+        "CREATE INDEX IF NOT EXISTS idx_analysis_history_user_risk ON analysis_history (user_id, risk_level)",
+        # cleanup_expired_sessions only ever touches active sessions
+        "CREATE INDEX IF NOT EXISTS idx_sessions_active_expires ON sessions (expires_at) WHERE is_active = 1",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)"
+    ]),
+    ("Per-user summary counters for get_user_stats", [
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_analyses INTEGER NOT NULL DEFAULT 0,
+            high_risk_analyses INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        # One bucket per user per UTC day backs the rolling 30-day count
+        """
+        CREATE TABLE IF NOT EXISTS user_daily_stats (
+            user_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            analyses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        ) WITHOUT ROWID
+        """
+    ] + USER_STATS_REBUILD),
+    ("Keyset pagination index for analysis history", [
+        # get_user_analysis_page: WHERE user_id = ? AND (created_at, id) < (?, ?)
+        # ORDER BY created_at DESC, id DESC - a backward scan of this index, no sort step
+        "CREATE INDEX IF NOT EXISTS idx_analysis_history_user_created_id ON analysis_history (user_id, created_at, id)",
+        # Superseded: same prefix, but ties on created_at come back in the wrong order
+        "DROP INDEX IF EXISTS idx_analysis_history_user_created"
+    ]),
+    # Repeat checks of the same regimen produce byte-identical results: store each
+    # distinct result once, compressed, and reference it by hash. analysis_history is
+    # rebuilt (portable alternative to ALTER TABLE DROP COLUMN); result_digest and
+    # compress_result are registered as SQL functions while migrations run.
+    # Run `python database.py vacuum` afterwards to return the freed pages to the OS.
+    ("Content-addressed, compressed analysis results", [
+        """
+        CREATE TABLE IF NOT EXISTS analysis_results (
+            hash BLOB PRIMARY KEY,
+            result BLOB NOT NULL
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR IGNORE INTO analysis_results (hash, result)
+        SELECT result_digest(analysis_result), compress_result(analysis_result)
+        FROM analysis_history
+        """,
+        """
+        CREATE TABLE analysis_history_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            doctor_a_medicines TEXT NOT NULL,
+            doctor_b_medicines TEXT NOT NULL,
+            interactions_found INTEGER NOT NULL,
+            risk_level TEXT NOT NULL,
+            result_hash BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (result_hash) REFERENCES analysis_results (hash)
+        )
+        """,
+        """
+        INSERT INTO analysis_history_new
+            (id, user_id, doctor_a_medicines, doctor_b_medicines, interactions_found, risk_level, result_hash, created_at)
+        SELECT id, user_id, doctor_a_medicines, doctor_b_medicines, interactions_found, risk_level,
+               result_digest(analysis_result), created_at
+        FROM analysis_history
+        """,
+        "DROP TABLE analysis_history",
+        "ALTER TABLE analysis_history_new RENAME TO analysis_history",
+        "CREATE INDEX idx_analysis_history_user_risk ON analysis_history (user_id, risk_level)",
+        "CREATE INDEX idx_analysis_history_user_created_id ON analysis_history (user_id, created_at, id)"
+    ]),
+    # Each worker process has its own session cache; a logout bumps this one row in the
+    # same transaction, and cache hits are only trusted while it is unchanged
+    ("Session revocation epoch shared by worker processes", [
+        """
+        CREATE TABLE IF NOT EXISTS session_epoch (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            epoch INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO session_epoch (id, epoch) VALUES (0, 0)"
+    ]),
+    # A logout appends the session id here; each process polls for new rows now and then
+    # and drops just those sessions from its cache, so cache hits never touch the database
+    ("Per-session revocation log replaces the session epoch", [
+        """
+        CREATE TABLE IF NOT EXISTS session_revocations (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "DROP TABLE IF EXISTS session_epoch"
+    ])
+]
+
+# Largest page get_user_analysis_page returns, whatever the caller asks for
+MAX_HISTORY_PAGE_SIZE = 100
+
+class ConnectionPool:
+    """
+    Thread-safe pool of persistent SQLite connections
+    Connections are shared across Flask's request threads (check_same_thread=False),
+    but each one is only ever used by a single thread at a time.
+    """
+
+    def __init__(self, db_path: str, size: int = 5, timeout: float = 30.0, health_check_interval: float = 30.0,
+                 pragmas: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            db_path: SQLite database file
+            size: Maximum number of open connections; 0 disables pooling (connect per call)
+            timeout: Seconds to wait for a free connection before raising TimeoutError
+            health_check_interval: Idle seconds after which a connection is probed before reuse
+            pragmas: PRAGMA name -> value applied to each new connection
+        """
+        self.db_path = db_path
+        self.pragmas = pragmas or {}
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(size, 1))
+        self._lock = threading.Lock()
+        self._open_connections = 0
+        self._closed = False
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self._open_connections += 1
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._open_connections -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checkout(self) -> sqlite3.Connection:
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(conn):
+                return conn
+            logger.warning("Discarding unhealthy pooled connection to %s", self.db_path)
+            self._discard(conn)
+
+    def _checkin(self, conn: sqlite3.Connection, failed: bool):
+        if self._closed or self.size == 0 or (failed and not self._is_healthy(conn)):
+            self._discard(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection; the block runs in a transaction that commits on success"""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if self.size > 0 and not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection available after {self.timeout}s")
+        
+        conn = None
+        failed = False
+        try:
+            conn = self._checkout()
+            with conn:
+                yield conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if conn is not None:
+                self._checkin(conn, failed)
+            if self.size > 0:
+                self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Current pool occupancy"""
+        return {
+            "size": self.size,
+            "open": self._open_connections,
+            "idle": self._idle.qsize()
+        }
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when returned"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+class PasswordHasher:
+    """
+    Bounded worker pool for bcrypt
+    bcrypt releases the GIL, so hashing inline lets every request thread of a login
+    storm burn a core at once. Here password work runs on a few dedicated, lower
+    priority threads: excess logins queue (up to max_pending, then TimeoutError)
+    while analysis requests keep the CPU.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 1, max_pending: int = 64, queue_timeout: float = 10.0,
+                 niceness: int = 10):
+        """
+        Args:
+            rounds: bcrypt work factor (log2 iterations) for new hashes
+            workers: Hashing threads, i.e. the most cores password work can occupy
+            max_pending: Bound on queued plus running calls
+            queue_timeout: Seconds a caller waits for a place in the queue before raising TimeoutError
+            niceness: Scheduling niceness added to the worker threads (Linux); 0 keeps normal priority
+        """
+        if not 4 <= rounds <= 31:
+            raise ValueError(f"bcrypt rounds must be between 4 and 31, got {rounds}")
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.niceness = niceness
+        
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="password-hasher",
+                                            initializer=self._lower_priority)
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._work_total = 0.0
+
+    def _lower_priority(self):
+        if self.niceness and hasattr(os, "setpriority") and hasattr(threading, "get_native_id"):
+            try:
+                # Linux applies PRIO_PROCESS to the calling thread when given its thread id
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.niceness)
+            except OSError as e:
+                logger.warning("Could not lower password hasher thread priority: %s", e)
+
+    def hash(self, password: str) -> str:
+        """bcrypt hash of password at the configured cost"""
+        hashed = self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+        return hashed.decode('utf-8')
+
+    def verify(self, password: str, hashed: str) -> bool:
+        """Check password against a bcrypt hash"""
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True if hashed was made with a different cost than the configured one"""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise TimeoutError("Password hashing queue is full")
+        try:
+            with self._lock:
+                self._queued += 1
+            return self._executor.submit(self._timed, time.perf_counter(), func, *args).result()
+        finally:
+            self._slots.release()
+
+    def _timed(self, submitted: float, func, *args):
+        started = time.perf_counter()
+        waited = started - submitted
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._work_total += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, counters and wait/work times in milliseconds"""
+        with self._lock:
+            completed = self._completed
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_total * 1000 / completed, 2) if completed else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 2),
+                "avg_hash_ms": round(self._work_total * 1000 / completed, 2) if completed else 0.0
+            }
+
+    def close(self):
+        """Finish queued work and stop the worker threads"""
+        self._executor.shutdown(wait=True)
 
 class DatabaseManager:
-    def __init__(self, db_path: str = "prescription_checker.db"):
-        """Initialize database manager"""
+    def __init__(self, db_path: str = "prescription_checker.db", pool_size: int = 5, profile: str = "performance",
+                 session_cache_size: int = 4096, session_cache_ttl: float = 60.0,
+                 session_revocation_poll: float = 0.5, password_hasher: Optional[PasswordHasher] = None):
+        """
+        Initialize database manager
+        
+        Args:
+            db_path: SQLite database file
+            pool_size: Persistent connections kept for reuse; 0 opens a new connection per call
+            profile: Connection PRAGMA profile, a key of PRAGMA_PROFILES
+            session_cache_size: Validated sessions kept in memory; 0 disables the cache
+            session_cache_ttl: Upper bound in seconds on how long a validated session is trusted
+                               without re-reading it
+            session_revocation_poll: Seconds between checks for sessions other processes logged
+                                     out; a logout elsewhere can be served from this process's
+                                     cache for up to this long (logouts here take effect at once)
+            password_hasher: Pool that runs bcrypt; defaults to PasswordHasher()
+        """
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f"Unknown database profile: {profile}")
+        
         self.db_path = db_path
+        self.profile = profile
+        self.pool = ConnectionPool(db_path, size=pool_size, pragmas=PRAGMA_PROFILES[profile])
+        self.session_cache = LRUCache(max_entries=session_cache_size, ttl=session_cache_ttl)
+        self.session_revocation_poll = session_revocation_poll
+        self.password_hasher = password_hasher or PasswordHasher()
+        # Bumped on every invalidation so a lookup racing a logout can't re-cache the session
+        self._session_generation = 0
+        self._session_lock = threading.Lock()
+        # Last session_revocations row this process has applied, and when to look for newer ones
+        self._revocation_seq = 0
+        self._next_revocation_check = 0.0
         self.init_database()
 
+    def _connection(self):
+        """Borrow a pooled connection (context manager, commits on success)"""
+        return self.pool.connection()
+
+    def close(self):
+        """Release all pooled database connections and stop the password hasher"""
+        self.pool.close()
+        self.password_hasher.close()
+
     def init_database(self):
         """Create database tables if they don't exist"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             # Users table
@@ -63,8 +502,38 @@ class DatabaseManager:
             
             conn.commit()
             
-            # Create demo user if it doesn't exist
-            self.create_demo_user()
+            self._apply_migrations(conn)
+            
+            # Sessions revoked before this process started were never in its cache
+            self._revocation_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM session_revocations').fetchone()[0]
+        
+        # Create demo user if it doesn't exist
+        self.create_demo_user()
+
+    def _apply_migrations(self, conn: sqlite3.Connection):
+        """Bring the schema up to date with SCHEMA_MIGRATIONS, one transaction per migration"""
+        target_version = len(SCHEMA_MIGRATIONS)
+        conn.create_function("result_digest", 1, result_digest, deterministic=True)
+        conn.create_function("compress_result", 1, compress_result, deterministic=True)
+        
+        while True:
+            # IMMEDIATE takes the write lock up front so concurrent workers migrate one at a time
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= target_version:
+                conn.commit()
+                return
+            
+            description, statements = SCHEMA_MIGRATIONS[version]
+            try:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            logger.info("Applied schema migration %d: %s", version + 1, description)
 
     def create_demo_user(self):
         """Create demo user for testing"""
@@ -72,39 +541,44 @@ class DatabaseManager:
             demo_user = self.get_user_by_email('demo@example.com')
             if not demo_user:
                 self.create_user('Demo User', 'demo@example.com', 'demo123')
-                print("Demo user created: demo@example.com / demo123")
+                logger.info("Demo user created: demo@example.com / demo123")
         except Exception as e:
-            print(f"Error creating demo user: {e}")
+            logger.error("Error creating demo user: %s", e)
 
     def hash_password(self, password: str) -> str:
-        """Hash password using bcrypt"""
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return hashed.decode('utf-8')
+        """Hash password using bcrypt (on the password hasher pool)"""
+        return self.password_hasher.hash(password)
 
     def verify_password(self, password: str, hashed: str) -> bool:
-        """Verify password against hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        """Verify password against hash (on the password hasher pool)"""
+        return self.password_hasher.verify(password, hashed)
 
     def create_user(self, name: str, email: str, password: str) -> Dict[str, Any]:
         """Create new user"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 # Check if user already exists
                 cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
                 if cursor.fetchone():
                     raise ValueError('User with this email already exists')
-                
-                # Hash password
-                password_hash = self.hash_password(password)
+            
+            # Hash password without holding a pooled connection
+            password_hash = self.hash_password(password)
+            
+            with self._connection() as conn:
+                cursor = conn.cursor()
                 
                 # Insert user
-                cursor.execute('''
-                    INSERT INTO users (name, email, password_hash)
-                    VALUES (?, ?, ?)
-                ''', (name, email, password_hash))
+                try:
+                    cursor.execute('''
+                        INSERT INTO users (name, email, password_hash)
+                        VALUES (?, ?, ?)
+                    ''', (name, email, password_hash))
+                except sqlite3.IntegrityError:
+                    # Lost a race with a concurrent signup for the same email
+                    raise ValueError('User with this email already exists')
                 
                 user_id = cursor.lastrowid
                 conn.commit()
@@ -115,13 +589,20 @@ class DatabaseManager:
                     'email': email,
                     'created_at': datetime.now().isoformat()
                 }
+        except TimeoutError:
+            raise
         except Exception as e:
             raise Exception(f"Error creating user: {str(e)}")
 
     def authenticate_user(self, email: str, password: str) -> Optional[Dict[str, Any]]:
-        """Authenticate user and return user data if successful"""
+        """
+        Authenticate user and return user data if successful
+        A stored hash made with a different bcrypt cost than the configured one is
+        replaced with a fresh hash of the (just verified) password.
+        Raises TimeoutError when the password hasher or connection pool is saturated.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -131,32 +612,46 @@ class DatabaseManager:
                 ''', (email,))
                 
                 user = cursor.fetchone()
-                
-                if user and self.verify_password(password, user[3]):
-                    # Update last login
-                    cursor.execute('''
-                        UPDATE users 
-                        SET last_login = CURRENT_TIMESTAMP 
-                        WHERE id = ?
-                    ''', (user[0],))
-                    conn.commit()
-                    
-                    return {
-                        'id': user[0],
-                        'name': user[1],
-                        'email': user[2],
-                        'last_login': user[4]
-                    }
-                
+            
+            # bcrypt runs on the hasher pool, not while holding a pooled connection
+            if not user or not self.verify_password(password, user[3]):
                 return None
+            
+            new_hash = self.hash_password(password) if self.password_hasher.needs_rehash(user[3]) else None
+            
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                # Update last login
+                cursor.execute('''
+                    UPDATE users 
+                    SET last_login = CURRENT_TIMESTAMP 
+                    WHERE id = ?
+                ''', (user[0],))
+                if new_hash:
+                    # Only if the password wasn't changed in the meantime
+                    cursor.execute(
+                        'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                        (new_hash, user[0], user[3])
+                    )
+                conn.commit()
+            
+            return {
+                'id': user[0],
+                'name': user[1],
+                'email': user[2],
+                'last_login': user[4]
+            }
+        except TimeoutError:
+            raise
         except Exception as e:
-            print(f"Error authenticating user: {e}")
+            logger.error("Error authenticating user: %s", e)
             return None
 
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get user by email"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -178,13 +673,13 @@ class DatabaseManager:
                 
                 return None
         except Exception as e:
-            print(f"Error getting user: {e}")
+            logger.error("Error getting user: %s", e)
             return None
 
     def create_session(self, user_id: int) -> str:
         """Create user session and return session ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 session_id = str(uuid.uuid4())
@@ -199,13 +694,19 @@ class DatabaseManager:
                 
                 return session_id
         except Exception as e:
-            print(f"Error creating session: {e}")
+            logger.error("Error creating session: %s", e)
             return None
 
     def get_session_user(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get user from session ID"""
+        self._apply_revocations()
+        generation = self._session_generation
+        cached = self.session_cache.get(session_id)
+        if cached is not None:
+            return dict(cached)
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -218,22 +719,72 @@ class DatabaseManager:
                 result = cursor.fetchone()
                 
                 if result:
-                    return {
+                    user = {
                         'id': result[0],
                         'name': result[1],
                         'email': result[2],
                         'session_expires': result[3]
                     }
+                    self._cache_session(session_id, user, generation)
+                    return dict(user)
                 
                 return None
         except Exception as e:
-            print(f"Error getting session user: {e}")
+            logger.error("Error getting session user: %s", e)
             return None
 
+    def _cache_session(self, session_id: str, user: Dict[str, Any], generation: int):
+        """Cache a validated session, never past its expires_at"""
+        # expires_at is compared against CURRENT_TIMESTAMP (UTC) in SQL; mirror that here
+        expires_at = datetime.fromisoformat(str(user['session_expires']))
+        remaining = (expires_at - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+        ttl = min(self.session_cache.ttl, remaining)
+        
+        with self._session_lock:
+            if ttl > 0 and generation == self._session_generation:
+                self.session_cache.set(session_id, user, ttl=ttl)
+
+    def _forget_sessions(self, session_id: Optional[str] = None):
+        """Drop one cached session (or all of them) and stop in-flight lookups from re-caching it"""
+        with self._session_lock:
+            self._session_generation += 1
+            if session_id is None:
+                self.session_cache.clear()
+            else:
+                self.session_cache.invalidate(session_id)
+
+    def _apply_revocations(self):
+        """Drop cached sessions other processes logged out; reads the log at most every session_revocation_poll seconds"""
+        now = time.monotonic()
+        with self._session_lock:
+            if now < self._next_revocation_check:
+                return
+            self._next_revocation_check = now + self.session_revocation_poll
+            since = self._revocation_seq
+        
+        try:
+            with self._connection() as conn:
+                rows = conn.execute('''
+                    SELECT seq, session_id FROM session_revocations WHERE seq > ? ORDER BY seq
+                ''', (since,)).fetchall()
+        except Exception as e:
+            logger.error("Error reading session revocations: %s", e)
+            return
+        
+        if rows:
+            with self._session_lock:
+                # The generation bump also stops lookups that read a revoked session
+                # before its logout committed from caching it
+                self._session_generation += 1
+                for _, revoked_id in rows:
+                    self.session_cache.invalidate(revoked_id)
+                self._revocation_seq = max(self._revocation_seq, rows[-1][0])
+
     def invalidate_session(self, session_id: str):
         """Invalidate user session (logout)"""
+        self._forget_sessions(session_id)
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -242,111 +793,219 @@ class DatabaseManager:
                     WHERE id = ?
                 ''', (session_id,))
                 
+                # Other worker processes drop it from their caches on their next poll
+                cursor.execute('INSERT INTO session_revocations (session_id) VALUES (?)', (session_id,))
+                
                 conn.commit()
         except Exception as e:
-            print(f"Error invalidating session: {e}")
+            logger.error("Error invalidating session: %s", e)
+        # A lookup that read the row before the commit may have cached it under the new generation
+        self._forget_sessions(session_id)
 
     def save_analysis_result(self, user_id: int, doctor_a_medicines: list, doctor_b_medicines: list, 
                            interactions_count: int, risk_level: str, full_result: dict):
         """Save analysis result to history"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                import json
-                
-                cursor.execute('''
-                    INSERT INTO analysis_history 
-                    (user_id, doctor_a_medicines, doctor_b_medicines, interactions_found, risk_level, analysis_result)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    json.dumps(doctor_a_medicines),
-                    json.dumps(doctor_b_medicines),
-                    interactions_count,
-                    risk_level,
-                    json.dumps(full_result)
-                ))
-                
-                conn.commit()
+            self.save_analysis_results([
+                (user_id, doctor_a_medicines, doctor_b_medicines, interactions_count, risk_level, full_result)
+            ])
         except Exception as e:
-            print(f"Error saving analysis result: {e}")
+            logger.error("Error saving analysis result: %s", e)
+
+    def save_analysis_results(self, records: List[Tuple[int, list, list, int, str, dict]]):
+        """
+        Save many analysis results in a single transaction
+        
+        Args:
+            records: (user_id, doctor_a_medicines, doctor_b_medicines, interactions_count, risk_level, full_result)
+                     tuples, in the same order as save_analysis_result's arguments
+        
+        Raises on failure so callers can decide how to recover
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            # Each distinct result is compressed and stored once; rows reference it by hash
+            history_rows = []
+            results = {}
+            for user_id, doctor_a_medicines, doctor_b_medicines, interactions_count, risk_level, full_result in records:
+                result_json = json.dumps(full_result, default=json_default)
+                digest = result_digest(result_json)
+                history_rows.append((user_id, json.dumps(doctor_a_medicines), json.dumps(doctor_b_medicines),
+                                     interactions_count, risk_level, digest))
+                results.setdefault(digest, result_json)
+            
+            # Only results not stored yet are worth compressing (a primary key probe each)
+            cursor.executemany('INSERT OR IGNORE INTO analysis_results (hash, result) VALUES (?, ?)', [
+                (digest, compress_result(result_json)) for digest, result_json in results.items()
+                if not cursor.execute('SELECT 1 FROM analysis_results WHERE hash = ?', (digest,)).fetchone()
+            ])
+            
+            cursor.executemany('''
+                INSERT INTO analysis_history 
+                (user_id, doctor_a_medicines, doctor_b_medicines, interactions_found, risk_level, result_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', history_rows)
+            
+            # Keep summary counters in step, in the same transaction
+            cursor.executemany('''
+                INSERT INTO user_stats (user_id, total_analyses, high_risk_analyses)
+                VALUES (?, 1, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    total_analyses = total_analyses + 1,
+                    high_risk_analyses = high_risk_analyses + excluded.high_risk_analyses
+            ''', [(record[0], int(record[4] == 'HIGH')) for record in records])
+            
+            cursor.executemany('''
+                INSERT INTO user_daily_stats (user_id, day, analyses)
+                VALUES (?, date('now'), 1)
+                ON CONFLICT (user_id, day) DO UPDATE SET analyses = analyses + 1
+            ''', [(record[0],) for record in records])
 
     def get_user_analysis_history(self, user_id: int, limit: int = 10) -> list:
-        """Get user's analysis history"""
+        """Get user's most recent analyses, full results included (first page of get_user_analysis_page)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT doctor_a_medicines, doctor_b_medicines, interactions_found, 
-                           risk_level, created_at, analysis_result
-                    FROM analysis_history
-                    WHERE user_id = ?
-                    ORDER BY created_at DESC
-                    LIMIT ?
-                ''', (user_id, limit))
-                
-                results = cursor.fetchall()
-                
-                import json
-                history = []
-                for result in results:
-                    history.append({
-                        'doctor_a_medicines': json.loads(result[0]),
-                        'doctor_b_medicines': json.loads(result[1]),
-                        'interactions_found': result[2],
-                        'risk_level': result[3],
-                        'date': result[4],
-                        'full_result': json.loads(result[5])
-                    })
-                
-                return history
+            return self.get_user_analysis_page(user_id, limit)['history']
         except Exception as e:
-            print(f"Error getting analysis history: {e}")
+            logger.error("Error getting analysis history: %s", e)
             return []
 
+    @staticmethod
+    def _encode_history_cursor(created_at: str, entry_id: int) -> str:
+        return base64.urlsafe_b64encode(f"{created_at}|{entry_id}".encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_history_cursor(cursor: str) -> Tuple[str, int]:
+        try:
+            created_at, entry_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().rsplit("|", 1)
+            return created_at, int(entry_id)
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor")
+
+    def get_user_analysis_page(self, user_id: int, limit: int = 10, cursor: Optional[str] = None,
+                               summary: bool = False) -> Dict[str, Any]:
+        """
+        One page of a user's analysis history, newest first
+
+        Pages are keyset-based on (created_at, id), so any page costs the same as the
+        first and rows saved meanwhile don't shift or repeat entries.
+
+        Args:
+            limit: Page size, clamped to 1..MAX_HISTORY_PAGE_SIZE
+            cursor: next_cursor from the previous page; None for the first page
+            summary: Leave out full_result (its blob is then neither read nor decoded)
+
+        Returns:
+            {"history": [...], "next_cursor": str or None when this is the last page}
+
+        Raises:
+            ValueError: if cursor is malformed
+        """
+        limit = max(1, min(int(limit), MAX_HISTORY_PAGE_SIZE))
+        columns = 'h.id, h.doctor_a_medicines, h.doctor_b_medicines, h.interactions_found, h.risk_level, h.created_at'
+        source = 'analysis_history h'
+        if not summary:
+            columns += ', r.result'
+            source += ' JOIN analysis_results r ON r.hash = h.result_hash'
+
+        if cursor is None:
+            where, params = 'h.user_id = ?', (user_id,)
+        else:
+            where, params = 'h.user_id = ? AND (h.created_at, h.id) < (?, ?)', (user_id, *self._decode_history_cursor(cursor))
+
+        with self._connection() as conn:
+            # One extra row tells us whether another page follows
+            rows = conn.execute(f'''
+                SELECT {columns}
+                FROM {source}
+                WHERE {where}
+                ORDER BY h.created_at DESC, h.id DESC
+                LIMIT ?
+            ''', (*params, limit + 1)).fetchall()
+
+        history = []
+        for row in rows[:limit]:
+            entry = {
+                'id': row[0],
+                'doctor_a_medicines': json.loads(row[1]),
+                'doctor_b_medicines': json.loads(row[2]),
+                'interactions_found': row[3],
+                'risk_level': row[4],
+                'date': row[5]
+            }
+            if not summary:
+                entry['full_result'] = decompress_result(row[6])
+            history.append(entry)
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = self._encode_history_cursor(last[5], last[0])
+        return {'history': history, 'next_cursor': next_cursor}
+
+    def get_analysis_entry(self, user_id: int, entry_id: int) -> Optional[Dict[str, Any]]:
+        """One of the user's analyses with its full result, or None if it isn't theirs or doesn't exist"""
+        with self._connection() as conn:
+            row = conn.execute('''
+                SELECT h.id, h.doctor_a_medicines, h.doctor_b_medicines, h.interactions_found,
+                       h.risk_level, h.created_at, r.result
+                FROM analysis_history h
+                JOIN analysis_results r ON r.hash = h.result_hash
+                WHERE h.id = ? AND h.user_id = ?
+            ''', (entry_id, user_id)).fetchone()
+
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'doctor_a_medicines': json.loads(row[1]),
+            'doctor_b_medicines': json.loads(row[2]),
+            'interactions_found': row[3],
+            'risk_level': row[4],
+            'date': row[5],
+            'full_result': decompress_result(row[6])
+        }
+
     def cleanup_expired_sessions(self):
         """Clean up expired sessions"""
+        self._forget_sessions()
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
                     UPDATE sessions 
                     SET is_active = 0 
-                    WHERE expires_at < CURRENT_TIMESTAMP
+                    WHERE is_active = 1 AND expires_at < CURRENT_TIMESTAMP
+                ''')
+                
+                # Cached sessions never outlive expires_at, so these revocations are spent
+                cursor.execute('''
+                    DELETE FROM session_revocations
+                    WHERE session_id IN (SELECT id FROM sessions WHERE expires_at < CURRENT_TIMESTAMP)
                 ''')
                 
                 conn.commit()
         except Exception as e:
-            print(f"Error cleaning up sessions: {e}")
+            logger.error("Error cleaning up sessions: %s", e)
 
     def get_user_stats(self, user_id: int) -> Dict[str, Any]:
         """Get user statistics"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
-                # Total analyses
+                # Counters are maintained by save_analysis_result; recent activity
+                # (last 30 days) is summed from the per-day buckets
                 cursor.execute('''
-                    SELECT COUNT(*) FROM analysis_history WHERE user_id = ?
-                ''', (user_id,))
-                total_analyses = cursor.fetchone()[0]
-                
-                # High risk analyses
-                cursor.execute('''
-                    SELECT COUNT(*) FROM analysis_history 
-                    WHERE user_id = ? AND risk_level = 'HIGH'
+                    SELECT total_analyses, high_risk_analyses,
+                           (SELECT COALESCE(SUM(analyses), 0) FROM user_daily_stats
+                            WHERE user_id = s.user_id AND day >= date('now', '-30 days'))
+                    FROM user_stats s
+                    WHERE user_id = ?
                 ''', (user_id,))
-                high_risk_count = cursor.fetchone()[0]
                 
-                # Recent activity (last 30 days)
-                cursor.execute('''
-                    SELECT COUNT(*) FROM analysis_history 
-                    WHERE user_id = ? AND created_at > datetime('now', '-30 days')
-                ''', (user_id,))
-                recent_analyses = cursor.fetchone()[0]
+                total_analyses, high_risk_count, recent_analyses = cursor.fetchone() or (0, 0, 0)
                 
                 return {
                     'total_analyses': total_analyses,
@@ -354,13 +1013,164 @@ class DatabaseManager:
                     'recent_analyses': recent_analyses
                 }
         except Exception as e:
-            print(f"Error getting user stats: {e}")
+            logger.error("Error getting user stats: %s", e)
             return {'total_analyses': 0, 'high_risk_analyses': 0, 'recent_analyses': 0}
 
+    def vacuum(self) -> Tuple[int, int]:
+        """Rewrite the database file to release free pages (e.g. after a migration); returns (bytes before, after)"""
+        with self._connection() as conn:
+            # Fold the WAL (if any) into the main file so both sizes are comparable
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            before = os.path.getsize(self.db_path)
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            after = os.path.getsize(self.db_path)
+        return before, after
+
+    def reconcile_user_stats(self) -> int:
+        """Rebuild summary counters from analysis_history; returns the number of users covered"""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for statement in USER_STATS_REBUILD:
+                conn.execute(statement)
+            return conn.execute("SELECT COUNT(*) FROM user_stats").fetchone()[0]
+
+class AnalysisHistoryWriter:
+    """
+    Write-behind queue for analysis history
+    Requests enqueue results and return immediately; a background thread batches
+    pending inserts into one save_analysis_results transaction, flushing when a
+    batch fills up or flush_interval elapses, whichever comes first.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db: DatabaseManager, batch_size: int = 200, flush_interval: float = 0.25,
+                 max_pending: int = 10000, enqueue_timeout: float = 1.0):
+        """
+        Args:
+            db: Database to persist into
+            batch_size: Maximum records per transaction
+            flush_interval: Longest a queued record waits for a batch to fill
+            max_pending: Bound on queued records (memory cap)
+            enqueue_timeout: How long submit() waits on a full queue before writing synchronously
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._written = 0
+        self._sync_fallbacks = 0
+        self._failed = 0
+        
+        self._thread = threading.Thread(target=self._run, name="analysis-history-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id: int, doctor_a_medicines: list, doctor_b_medicines: list,
+               interactions_count: int, risk_level: str, full_result: dict):
+        """Queue an analysis result for persistence (same arguments as save_analysis_result)"""
+        # Shallow copy: callers typically keep decorating the result dict after saving it
+        record = (user_id, doctor_a_medicines, doctor_b_medicines, interactions_count, risk_level, dict(full_result))
+        
+        if not self._closed:
+            try:
+                # Backpressure: a full queue stalls the caller briefly...
+                self._queue.put(record, timeout=self.enqueue_timeout)
+                return
+            except queue.Full:
+                pass
+        
+        # ...and then it pays for its own write rather than losing the record
+        self._sync_fallbacks += 1
+        self.db.save_analysis_result(*record)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            self._flush(batch)
+
+    def _flush(self, batch: List[tuple]):
+        try:
+            self.db.save_analysis_results(batch)
+            self._written += len(batch)
+        except Exception as e:
+            # Don't let one bad record sink the batch: retry individually
+            logger.error("Error saving batch of %d analysis results, retrying one by one: %s", len(batch), e)
+            for record in batch:
+                try:
+                    self.db.save_analysis_results([record])
+                    self._written += 1
+                except Exception as record_error:
+                    self._failed += 1
+                    logger.error("Error saving analysis result: %s", record_error)
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth and persistence counters"""
+        return {
+            "pending": self._queue.qsize(),
+            "written": self._written,
+            "sync_fallbacks": self._sync_fallbacks,
+            "failed": self._failed
+        }
+
+    def close(self):
+        """Stop accepting records and durably write everything still queued"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+        
+        # Records that raced in behind the stop marker
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftovers:
+            self._flush(leftovers)
+
 # Example usage
 if __name__ == "__main__":
+    import sys
+    
     db = DatabaseManager()
     
+    # Maintenance: python database.py reconcile-stats
+    if sys.argv[1:] == ["reconcile-stats"]:
+        users = db.reconcile_user_stats()
+        print(f"✅ Rebuilt analysis stats for {users} users from analysis_history")
+        sys.exit(0)
+    
+    # Maintenance: python database.py vacuum
+    if sys.argv[1:] == ["vacuum"]:
+        before, after = db.vacuum()
+        print(f"✅ Vacuumed {db.db_path}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+        sys.exit(0)
+    
     print("🔧 Database initialized successfully!")
     print("📊 Demo user available: demo@example.com / demo123")
     
@@ -376,4 +1186,4 @@ if __name__ == "__main__":
     if auth_result:
         print(f"✅ Authentication successful: {auth_result}")
     else:
-        print("❌ Authentication failed")
\ No newline at end of file
+        print("❌ Authentication failed")
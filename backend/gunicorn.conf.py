@@ -0,0 +1,41 @@
+"""
+Production WSGI server settings for the Flask API (app.py)
+Usage: cd backend && gunicorn -c gunicorn.conf.py app:app
+The asyncio variant (asgi.py) runs under the same settings with uvicorn workers:
+       gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker asgi:app
+
+A pre-forking master supervises worker processes, each importing app.py and so
+running its own conflict checker, connection pool, history writer and bcrypt pool
+(SQLite, the database file and a compiled knowledge base are shared through the OS).
+`kill -HUP <master pid>` restarts workers gracefully, which also reloads the knowledge base.
+All settings can be overridden on the command line or with the SPARD_* variables below.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("SPARD_BIND", "0.0.0.0:5000")
+
+# Analysis is CPU-bound Python, so processes (not threads) provide the parallelism;
+# a few threads per worker overlap SQLite and network waits
+workers = int(os.environ.get("SPARD_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("SPARD_THREADS", "4"))
+
+# app.py starts threads (history writer, knowledge base watcher, bcrypt pool) and opens
+# SQLite connections at import; neither survives fork, so each worker imports it itself
+preload_app = False
+
+# Every worker has its own bcrypt pool: one thread each unless configured otherwise
+raw_env = [f"SPARD_BCRYPT_WORKERS={os.environ.get('SPARD_BCRYPT_WORKERS', '1')}"]
+
+# gthread workers heartbeat from their main thread, so long /check-conflicts/stream
+# jobs are not killed by this; it only catches wedged workers
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Access logging costs throughput; point at "-" to log requests to stdout
+accesslog = os.environ.get("SPARD_ACCESS_LOG")
+errorlog = "-"
+loglevel = os.environ.get("SPARD_LOG_LEVEL", "info").lower()
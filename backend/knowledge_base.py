@@ -0,0 +1,779 @@
+"""
+Conflict knowledge base for Prescription Conflict Checker
+Loads the versioned drug data file and precompiles the lookup indexes the interaction engines use,
+or memory-maps a compiled copy of it for large formularies
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from name_resolver import NameResolver
+from records import AllergyEntry, ConflictEntry, Interaction, MedicineEntry, medicine_entry
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # optional: only the "numpy" interaction engine needs it
+    np = None
+
+DEFAULT_KNOWLEDGE_BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "conflict_database.json")
+
+
+def parse_knowledge_base(data: Any) -> Tuple[Any, Dict[str, dict], Dict[str, str]]:
+    """
+    Validate a decoded knowledge base document
+
+    Accepts the versioned format {"version": ..., "medicines": {...}, "aliases": {...}}
+    ("aliases", brand name or synonym -> medicine, is optional) as well as the legacy
+    export format, a plain {medicine: {...}} mapping (reported as version None).
+
+    Returns:
+        (version, medicines, aliases)
+
+    Raises:
+        ValueError: if the document does not describe a conflict database
+    """
+    if isinstance(data, dict) and isinstance(data.get("medicines"), dict) and "version" in data:
+        version, medicines, aliases = data["version"], data["medicines"], data.get("aliases") or {}
+    else:
+        version, medicines, aliases = None, data, {}
+
+    if not isinstance(medicines, dict):
+        raise ValueError("Conflict database must be a JSON object of medicines")
+
+    # Every structural problem is a ValueError, so a bad edit never reaches the index builders
+    for medicine, medicine_data in medicines.items():
+        if not isinstance(medicine, str):
+            raise ValueError(f"Medicine name {medicine!r} must be a string")
+        if not isinstance(medicine_data, dict):
+            raise ValueError(f"Entry for {medicine} must be an object")
+        conflicts = medicine_data.get("conflicts", [])
+        if not isinstance(conflicts, list):
+            raise ValueError(f"Conflicts for {medicine} must be a list")
+        for conflict in conflicts:
+            if not isinstance(conflict, dict) or "drug" not in conflict or "reason" not in conflict:
+                raise ValueError(f"Conflicts for {medicine} must have 'drug' and 'reason'")
+            if not isinstance(conflict["drug"], str) or not isinstance(conflict["reason"], str):
+                raise ValueError(f"Conflicts for {medicine} must have string 'drug' and 'reason'")
+        allergy_conflicts = medicine_data.get("allergy_conflicts", [])
+        if not isinstance(allergy_conflicts, list):
+            raise ValueError(f"Allergy conflicts for {medicine} must be a list")
+        for allergy_info in allergy_conflicts:
+            if not isinstance(allergy_info, dict):
+                raise ValueError(f"Allergy conflicts for {medicine} must be objects")
+            if any(allergy_info.get(field) is not None and not isinstance(allergy_info[field], str)
+                   for field in ("allergy", "reason")):
+                raise ValueError(f"Allergy conflicts for {medicine} must have string 'allergy' and 'reason'")
+
+    if not isinstance(aliases, dict):
+        raise ValueError("Aliases must be a JSON object")
+    for alias, medicine in aliases.items():
+        if not isinstance(medicine, str):
+            raise ValueError(f"Alias {alias} must map to a medicine name")
+        if medicine not in medicines:
+            raise ValueError(f"Alias {alias} refers to unknown medicine {medicine}")
+
+    return version, medicines, aliases
+
+
+def load_knowledge_base(path: str = DEFAULT_KNOWLEDGE_BASE_PATH) -> Union["KnowledgeBase", "CompiledKnowledgeBase"]:
+    """
+    Read and index a knowledge base data file
+    Compiled files (see compile_knowledge_base) are memory-mapped instead of parsed.
+
+    Raises:
+        OSError: if the file cannot be read
+        ValueError: if it is not a valid conflict database
+    """
+    with open(path, "rb") as f:
+        compiled = f.read(len(COMPILED_MAGIC)) == COMPILED_MAGIC
+    if compiled:
+        return CompiledKnowledgeBase(path)
+
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in {path}: {e}")
+    version, medicines, aliases = parse_knowledge_base(data)
+    return KnowledgeBase(medicines, version, aliases)
+
+
+def _as_scanned(medicines: List[str], pairs: List[Tuple[int, int]], interactions: List[Interaction]) -> List[Interaction]:
+    """
+    Interactions found at the (i, j) position pairs, as the original pairwise scan reported them
+
+    That scan reported a pair only the later medicine declares just once, and only if the two
+    drugs had not been reported yet. That only matters when a medicine is listed twice.
+    """
+    if len(interactions) < 2 or len(set(medicines)) == len(medicines):
+        return interactions
+
+    reported = set()
+    scanned = []
+    for (i, j), interaction in zip(pairs, interactions):
+        drugs = frozenset((medicines[i], medicines[j]))
+        if interaction.pair == f"{medicines[i]} + {medicines[j]}" or drugs not in reported:
+            scanned.append(interaction)
+            reported.add(drugs)
+    return scanned
+
+
+class KnowledgeBase:
+    """
+    One immutable snapshot of the conflict database plus every index derived from it
+    Readers grab a reference once and use it for the whole request, so replacing the
+    checker's snapshot never exposes a half-built index.
+    """
+
+    def __init__(self, medicines: Dict[str, Any], version: Any = None, aliases: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            medicines: {medicine: {"conflicts": [...], "allergy_conflicts": [...]}} dicts or MedicineEntry records
+            version: Data version declared by the knowledge base file
+            aliases: Brand name or synonym -> medicine
+        """
+        # Repeated reasons collapse to one string object shared by entries and indexes
+        reasons: Dict[str, str] = {}
+        medicines = {medicine: medicine_entry(medicine_data, reasons) for medicine, medicine_data in medicines.items()}
+        self.medicines: Dict[str, MedicineEntry] = medicines
+        self.version = version
+        self.aliases = aliases or {}
+        # Set by ConflictChecker when the snapshot is installed; part of result cache keys
+        self.generation = 0
+
+        # Unordered pair -> {declaring drug: reason}. Keeping the declaring side
+        # lets us report the pair in the same direction the dataset lists it.
+        interaction_index: Dict[FrozenSet[str], Dict[str, str]] = {}
+
+        for medicine, medicine_data in medicines.items():
+            for conflict in medicine_data.conflicts:
+                pair = frozenset((medicine, conflict.drug))
+                interaction_index.setdefault(pair, {}).setdefault(medicine, conflict.reason)
+
+        # Drug -> every drug it interacts with, regardless of which side declared it
+        neighbors: Dict[str, set] = {}
+        for pair in interaction_index:
+            members = tuple(pair)
+            first, second = members if len(members) == 2 else members * 2
+            neighbors.setdefault(first, set()).add(second)
+            neighbors.setdefault(second, set()).add(first)
+
+        # Allergy class -> [(medicine, position in its allergy list, reason)]
+        allergy_index: Dict[str, List[Tuple[str, int, Optional[str]]]] = {}
+        for medicine, medicine_data in medicines.items():
+            for slot, allergy_info in enumerate(medicine_data.allergy_conflicts):
+                allergy = (allergy_info.allergy or "").lower().strip()
+                allergy_index.setdefault(allergy, []).append((medicine, slot, allergy_info.reason))
+
+        self.interaction_index = interaction_index
+        self.interaction_neighbors = {drug: frozenset(nbrs) for drug, nbrs in neighbors.items()}
+        self.allergy_index = allergy_index
+
+        # Bitmask and matrix forms for the bitset/numpy engines, built on first use.
+        # Two threads may both build one; either result is correct.
+        self._bitset_index = None
+        self._numpy_index = None
+        self._name_resolver = None
+
+    def to_document(self) -> Dict[str, Any]:
+        """The versioned file format this snapshot was (or would be) loaded from"""
+        return {"version": self.version, "medicines": self.medicines, "aliases": self.aliases}
+
+    def name_resolver(self) -> NameResolver:
+        """Typo-tolerant index over the medicine names and aliases, built on first use (ConflictChecker builds it before installing the snapshot)"""
+        resolver = self._name_resolver
+        if resolver is None:
+            # Drugs that only appear as conflict partners must resolve to themselves too
+            names = list(self.medicines) + [drug for drug in self.interaction_neighbors if drug not in self.medicines]
+            resolver = self._name_resolver = NameResolver(names, self.aliases)
+        return resolver
+
+    def bitset_index(self) -> tuple:
+        """
+        (drug -> bit position, drug -> int bitmask of its interacting drugs) for the bitset engine
+        Only drugs that take part in at least one interaction get a bit.
+        """
+        bitset_index = self._bitset_index
+        if bitset_index is None:
+            neighbors = self.interaction_neighbors
+            drug_bits = {drug: bit for bit, drug in enumerate(sorted(neighbors))}
+
+            # Set bits in a byte buffer and convert once, rather than OR-ing growing ints
+            neighbor_masks = {}
+            for drug, drug_neighbors in neighbors.items():
+                buffer = bytearray((len(drug_bits) + 7) // 8)
+                for neighbor in drug_neighbors:
+                    bit = drug_bits[neighbor]
+                    buffer[bit >> 3] |= 1 << (bit & 7)
+                neighbor_masks[drug] = int.from_bytes(buffer, "little")
+
+            bitset_index = self._bitset_index = (drug_bits, neighbor_masks)
+        return bitset_index
+
+    def numpy_index(self) -> tuple:
+        """
+        (drug -> id, symmetric boolean adjacency matrix) for the numpy engine
+        Only drugs that take part in at least one interaction get an id. The matrix has
+        one extra all-False row/column that pads prescriptions of different lengths.
+        """
+        numpy_index = self._numpy_index
+        if numpy_index is None:
+            neighbors = self.interaction_neighbors
+            drug_ids = {drug: drug_id for drug_id, drug in enumerate(sorted(neighbors))}
+
+            adjacency = np.zeros((len(drug_ids) + 1, len(drug_ids) + 1), dtype=bool)
+            for drug, drug_neighbors in neighbors.items():
+                adjacency[drug_ids[drug], [drug_ids[neighbor] for neighbor in drug_neighbors]] = True
+
+            numpy_index = self._numpy_index = (drug_ids, adjacency)
+        return numpy_index
+
+    def find_interactions(self, medicines: List[str], engine: str) -> List[Interaction]:
+        """Dispatch interaction lookup to the requested engine"""
+        if engine == "pairwise":
+            return self.find_interactions_pairwise(medicines)
+        if engine == "adjacency":
+            return self.find_interactions_adjacency(medicines)
+        if engine == "bitset":
+            return self.find_interactions_bitset(medicines)
+        return self.find_interactions_numpy(medicines)
+
+    def pair_interaction(self, med1: str, med2: str) -> Optional[Interaction]:
+        """Interaction entry for an ordered pair of medicines, or None if they don't interact"""
+        declared = self.interaction_index.get(frozenset((med1, med2)))
+        if not declared:
+            return None
+
+        # Prefer med1's own entry; fall back to med2's (bidirectional conflicts)
+        if med1 in declared:
+            return Interaction(f"{med1} + {med2}", declared[med1])
+        return Interaction(f"{med2} + {med1}", declared[med2])
+
+    def find_interactions_pairwise(self, medicines: List[str]) -> List[Interaction]:
+        """Find all drug-drug interactions among the medicines"""
+        interactions = []
+        pairs = []
+
+        # Check each pair of medicines
+        for i, med1 in enumerate(medicines):
+            for j in range(i + 1, len(medicines)):
+                interaction = self.pair_interaction(med1, medicines[j])
+                if interaction:
+                    interactions.append(interaction)
+                    pairs.append((i, j))
+
+        return _as_scanned(medicines, pairs, interactions)
+
+    def find_interactions_adjacency(self, medicines: List[str]) -> List[Interaction]:
+        """
+        Find drug-drug interactions by intersecting each medicine's neighbor set
+        with the submitted medicines. Cost follows the number of known neighbors
+        instead of the number of pairs; output matches find_interactions_pairwise.
+        """
+        positions: Dict[str, List[int]] = {}
+        for index, medicine in enumerate(medicines):
+            positions.setdefault(medicine, []).append(index)
+
+        neighbors = self.interaction_neighbors
+        pairs = []
+        for i, med1 in enumerate(medicines):
+            for med2 in neighbors.get(med1, ()):
+                for j in positions.get(med2, ()):
+                    if j > i:
+                        pairs.append((i, j))
+
+        # Report in the same order the pairwise scan would
+        pairs.sort()
+        return _as_scanned(medicines, pairs, [self.pair_interaction(medicines[i], medicines[j]) for i, j in pairs])
+
+    def find_interactions_bitset(self, medicines: List[str]) -> List[Interaction]:
+        """
+        Find drug-drug interactions with int bitmasks: the prescription becomes one mask,
+        and each medicine's interacting partners are mask & its neighbor mask
+        """
+        drug_bits, neighbor_masks = self.bitset_index()
+
+        prescription_mask = 0
+        bit_positions: Dict[int, List[int]] = {}
+        for index, medicine in enumerate(medicines):
+            bit = drug_bits.get(medicine)
+            if bit is not None:
+                prescription_mask |= 1 << bit
+                bit_positions.setdefault(bit, []).append(index)
+
+        pairs = []
+        for i, medicine in enumerate(medicines):
+            hits = prescription_mask & neighbor_masks.get(medicine, 0)
+            while hits:
+                lowest = hits & -hits
+                hits ^= lowest
+                for j in bit_positions[lowest.bit_length() - 1]:
+                    if j > i:
+                        pairs.append((i, j))
+
+        # Report in the same order the pairwise scan would
+        pairs.sort()
+        return _as_scanned(medicines, pairs, [self.pair_interaction(medicines[i], medicines[j]) for i, j in pairs])
+
+    def find_interactions_numpy(self, medicines: List[str]) -> List[Interaction]:
+        """Find drug-drug interactions by slicing the adjacency matrix to the submitted medicines"""
+        drug_ids, adjacency = self.numpy_index()
+
+        positions = [index for index, medicine in enumerate(medicines) if medicine in drug_ids]
+        if len(positions) < 2:
+            return []
+
+        ids = [drug_ids[medicines[index]] for index in positions]
+        rows, cols = np.nonzero(np.triu(adjacency[np.ix_(ids, ids)], 1))
+
+        # positions ascend, so row-major nonzero order is the pairwise scan order
+        pairs = [(positions[row], positions[col]) for row, col in zip(rows.tolist(), cols.tolist())]
+        return _as_scanned(medicines, pairs, [self.pair_interaction(medicines[i], medicines[j]) for i, j in pairs])
+
+    def find_interactions_numpy_batch(self, medicine_lists: List[List[str]], max_rows: int = 4096) -> List[List[Interaction]]:
+        """
+        Vectorized interaction lookup for many prescriptions at once
+
+        Each prescription is encoded as a padded vector of drug ids; one fancy-indexing
+        pass gathers every prescription's k x k block of the adjacency matrix, and the
+        upper triangle of each block holds that prescription's interacting pairs.
+        """
+        drug_ids, adjacency = self.numpy_index()
+        padding_id = len(drug_ids)
+        results: List[List[Interaction]] = [[] for _ in medicine_lists]
+        result_pairs: List[List[Tuple[int, int]]] = [[] for _ in medicine_lists]
+
+        # Positions (within each list) of the medicines that have any interactions at all
+        known = [[index for index, medicine in enumerate(medicines) if medicine in drug_ids] for medicines in medicine_lists]
+        width = max((len(indexes) for indexes in known), default=0)
+        if width < 2:
+            return results
+
+        # Bound the (rows x k x k) intermediate to a few tens of MB
+        upper = np.triu(np.ones((width, width), dtype=bool), 1)
+        rows_per_pass = max(1, min(max_rows, (1 << 24) // (width * width)))
+
+        for start in range(0, len(medicine_lists), rows_per_pass):
+            block = range(start, min(start + rows_per_pass, len(medicine_lists)))
+
+            ids = np.full((len(block), width), padding_id, dtype=np.intp)
+            for row, list_index in enumerate(block):
+                medicines = medicine_lists[list_index]
+                indexes = known[list_index]
+                ids[row, :len(indexes)] = [drug_ids[medicines[index]] for index in indexes]
+
+            pairs = adjacency[ids[:, :, None], ids[:, None, :]] & upper
+
+            # Row-major nonzero order is (prescription, first slot, second slot); slots
+            # follow list positions, so each prescription comes out in pairwise scan order
+            for row, i, j in zip(*(axis.tolist() for axis in np.nonzero(pairs))):
+                list_index = block[row]
+                medicines = medicine_lists[list_index]
+                indexes = known[list_index]
+                results[list_index].append(self.pair_interaction(medicines[indexes[i]], medicines[indexes[j]]))
+                result_pairs[list_index].append((indexes[i], indexes[j]))
+
+        return [_as_scanned(medicines, pairs, interactions)
+                for medicines, pairs, interactions in zip(medicine_lists, result_pairs, results)]
+
+    def match_user_allergies(self, medicines: List[str], allergies: Iterable[str]) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Probe the inverted allergy index - EXACT MATCH ONLY, no partial matching
+
+        Returns:
+            (medicine, normalized allergy, dataset reason) tuples in prescription order,
+            then in the dataset's order for each medicine
+        """
+        positions: Dict[str, List[Tuple[int, str]]] = {}
+        for index, medicine in enumerate(medicines):
+            positions.setdefault(medicine.lower().strip(), []).append((index, medicine))
+
+        matches = []
+        for allergy in allergies:
+            for indexed_medicine, slot, reason in self.allergy_index.get(allergy, ()):
+                for index, medicine in positions.get(indexed_medicine, ()):
+                    matches.append((index, slot, medicine, allergy, reason))
+
+        matches.sort(key=lambda match: (match[0], match[1]))
+        return [(medicine, allergy, reason) for _, _, medicine, allergy, reason in matches]
+
+
+# Compiled knowledge base: one read-only file, memory-mapped so every worker
+# process shares the same page-cache pages instead of holding its own dicts.
+#
+# Layout (little-endian): header "<4sII" (magic, format, section count), then one
+# "<QQ" (offset, length) per section. Sections are 8-byte aligned; "u32" sections
+# are arrays of unsigned 32-bit ints and NO_ENTRY (0xFFFFFFFF) marks a missing value.
+COMPILED_MAGIC = b"SPKB"
+COMPILED_FORMAT = 1
+NO_ENTRY = 0xFFFFFFFF
+
+(_META,                                       # JSON {"version": ..., "aliases": {...}}
+ _DRUG_OFFSETS, _DRUG_BLOB,                   # drug names sorted by UTF-8 bytes; drug id = position
+ _STRING_OFFSETS, _STRING_BLOB,               # deduplicated reason / allergy-name pool
+ _NEIGHBOR_OFFSETS, _NEIGHBORS,               # u32 per drug: sorted ids of drugs it interacts with
+ _NEIGHBOR_REASONS,                           # u32 parallel to _NEIGHBORS: reason this drug declared, or NO_ENTRY
+ _MEDICINE_ORDER, _MEDICINE_RANK,             # u32: data file key order, and drug id -> position in it (or NO_ENTRY)
+ _DECLARED_OFFSETS, _DECLARED,                # u32 per drug: (drug id, reason id) as listed under "conflicts"
+ _ALLERGY_DECL_OFFSETS, _ALLERGY_DECL,        # u32 per drug: (allergy string, reason) as listed under "allergy_conflicts"
+ _ALLERGY_KEY_OFFSETS, _ALLERGY_KEY_BLOB,     # normalized allergy names, sorted
+ _ALLERGY_ROW_OFFSETS, _ALLERGY_ROWS,         # u32 per allergy: (drug id, slot, reason id)
+ ) = range(18)
+_SECTION_COUNT = 18
+
+
+def _u32(values: Iterable[int]) -> bytes:
+    table = array("I", values)
+    if sys.byteorder != "little":
+        table.byteswap()
+    return table.tobytes()
+
+
+def _string_sections(strings: List[str]) -> Tuple[bytes, bytes]:
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = [0]
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    return _u32(offsets), b"".join(encoded)
+
+
+def compile_knowledge_base(kb: KnowledgeBase, path: str):
+    """
+    Write kb in the compiled, memory-mappable format
+
+    Only the "drug", "allergy" and "reason" fields are kept. The file is written next
+    to path and renamed into place, so processes that still map the old file are unaffected.
+
+    Raises:
+        ValueError: if a reason or allergy is not a string
+    """
+    medicines = kb.medicines
+    strings: Dict[str, int] = {}
+
+    def string_id(value: Optional[str]) -> int:
+        if value is None:
+            return NO_ENTRY
+        if not isinstance(value, str):
+            raise ValueError(f"Cannot compile non-string value {value!r}")
+        return strings.setdefault(value, len(strings))
+
+    names = set(medicines)
+    for medicine_data in medicines.values():
+        names.update(conflict.drug for conflict in medicine_data.conflicts)
+    drugs = sorted(names, key=lambda name: name.encode("utf-8"))
+    drug_ids = {drug: drug_id for drug_id, drug in enumerate(drugs)}
+
+    # Sorted pair table, stored once per direction: (drug, neighbor) -> reason drug declared
+    neighbor_offsets, neighbors, neighbor_reasons = [0], [], []
+    for drug in drugs:
+        declared_here = []
+        for neighbor in kb.interaction_neighbors.get(drug, ()):
+            reason = kb.interaction_index[frozenset((drug, neighbor))].get(drug)
+            declared_here.append((drug_ids[neighbor], string_id(reason)))
+        declared_here.sort()
+        neighbors.extend(neighbor_id for neighbor_id, _ in declared_here)
+        neighbor_reasons.extend(reason_id for _, reason_id in declared_here)
+        neighbor_offsets.append(len(neighbors))
+
+    medicine_rank = [NO_ENTRY] * len(drugs)
+    medicine_order = []
+    for rank, medicine in enumerate(medicines):
+        medicine_rank[drug_ids[medicine]] = rank
+        medicine_order.append(drug_ids[medicine])
+
+    declared_offsets, declared = [0], []
+    allergy_decl_offsets, allergy_decl = [0], []
+    for drug in drugs:
+        medicine_data = medicines.get(drug)
+        for conflict in medicine_data.conflicts if medicine_data else ():
+            declared.extend((drug_ids[conflict.drug], string_id(conflict.reason)))
+        declared_offsets.append(len(declared) // 2)
+        for allergy_info in medicine_data.allergy_conflicts if medicine_data else ():
+            allergy_decl.extend((string_id(allergy_info.allergy), string_id(allergy_info.reason)))
+        allergy_decl_offsets.append(len(allergy_decl) // 2)
+
+    allergy_keys = sorted(kb.allergy_index, key=lambda allergy: allergy.encode("utf-8"))
+    allergy_row_offsets, allergy_rows = [0], []
+    for allergy in allergy_keys:
+        for medicine, slot, reason in kb.allergy_index[allergy]:
+            allergy_rows.extend((drug_ids[medicine], slot, string_id(reason)))
+        allergy_row_offsets.append(len(allergy_rows) // 3)
+
+    sections = [json.dumps({"version": kb.version, "aliases": kb.aliases}).encode("utf-8")]
+    sections.extend(_string_sections(drugs))
+    sections.extend(_string_sections(list(strings)))
+    sections.extend((_u32(neighbor_offsets), _u32(neighbors), _u32(neighbor_reasons),
+                     _u32(medicine_order), _u32(medicine_rank),
+                     _u32(declared_offsets), _u32(declared),
+                     _u32(allergy_decl_offsets), _u32(allergy_decl)))
+    sections.extend(_string_sections(allergy_keys))
+    sections.extend((_u32(allergy_row_offsets), _u32(allergy_rows)))
+
+    header_size = struct.calcsize("<4sII") + struct.calcsize("<QQ") * len(sections)
+    table, position = [], (header_size + 7) & ~7
+    for section in sections:
+        table.append((position, len(section)))
+        position = (position + len(section) + 7) & ~7
+
+    temp_path = f"{path}.tmp{os.getpid()}"
+    with open(temp_path, "wb") as f:
+        f.write(struct.pack("<4sII", COMPILED_MAGIC, COMPILED_FORMAT, len(sections)))
+        for offset, length in table:
+            f.write(struct.pack("<QQ", offset, length))
+        for (offset, _), section in zip(table, sections):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(section)
+    os.replace(temp_path, path)
+
+
+class _StringTable:
+    """Sequence view over an (offsets, blob) section pair; items are bytes, so bisect works on it"""
+    __slots__ = ("offsets", "blob")
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> bytes:
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]])
+
+    def text(self, index: int) -> str:
+        return self[index].decode("utf-8")
+
+    def find(self, value: str) -> int:
+        """Position of value, or -1"""
+        key = value.encode("utf-8")
+        index = bisect_left(self, key)
+        return index if index < len(self) and self[index] == key else -1
+
+
+class _CompiledMedicines(Mapping):
+    """Read-only {medicine: MedicineEntry} view, decoded on access"""
+
+    def __init__(self, kb: "CompiledKnowledgeBase"):
+        self._kb = kb
+
+    def __len__(self) -> int:
+        return len(self._kb._medicine_order)
+
+    def __iter__(self):
+        drugs = self._kb._drugs
+        for drug_id in self._kb._medicine_order:
+            yield drugs.text(drug_id)
+
+    def __contains__(self, medicine) -> bool:
+        return isinstance(medicine, str) and self._kb._medicine_id(medicine) >= 0
+
+    def __getitem__(self, medicine: str) -> MedicineEntry:
+        drug_id = self._kb._medicine_id(medicine) if isinstance(medicine, str) else -1
+        if drug_id < 0:
+            raise KeyError(medicine)
+        return self._kb._decode_medicine(drug_id)
+
+
+class CompiledKnowledgeBase:
+    """
+    KnowledgeBase backed by a memory-mapped compiled file (see compile_knowledge_base)
+
+    Opening only reads the header; pages are faulted in as lookups touch them and are
+    shared between processes mapping the same file. Lookups binary-search the sorted
+    tables instead of building per-process dicts. "pairwise" and "adjacency" run as
+    usual; "bitset" and "numpy" requests walk the pair table like "adjacency" (their
+    indexes would copy the whole graph per worker); the first one is logged.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise ValueError("Compiled knowledge bases are only supported on little-endian hosts")
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, file_format, count = struct.unpack_from("<4sII", self._mmap, 0)
+        if magic != COMPILED_MAGIC or file_format != COMPILED_FORMAT or count != _SECTION_COUNT:
+            raise ValueError(f"{path} is not a compiled knowledge base (format {COMPILED_FORMAT})")
+
+        view = memoryview(self._mmap)
+        sections = [view[offset:offset + length]
+                    for offset, length in struct.iter_unpack("<QQ", view[12:12 + 16 * count])]
+        u32 = lambda index: sections[index].cast("I")
+
+        meta = json.loads(bytes(sections[_META]).decode("utf-8"))
+        self.version = meta["version"]
+        self.aliases = meta.get("aliases", {})
+        self.generation = 0
+        self.path = path
+        self._drugs = _StringTable(u32(_DRUG_OFFSETS), sections[_DRUG_BLOB])
+        self._strings = _StringTable(u32(_STRING_OFFSETS), sections[_STRING_BLOB])
+        self._neighbor_offsets = u32(_NEIGHBOR_OFFSETS)
+        self._neighbors = u32(_NEIGHBORS)
+        self._neighbor_reasons = u32(_NEIGHBOR_REASONS)
+        self._medicine_order = u32(_MEDICINE_ORDER)
+        self._medicine_rank = u32(_MEDICINE_RANK)
+        self._declared_offsets = u32(_DECLARED_OFFSETS)
+        self._declared = u32(_DECLARED)
+        self._allergy_decl_offsets = u32(_ALLERGY_DECL_OFFSETS)
+        self._allergy_decl = u32(_ALLERGY_DECL)
+        self._allergy_keys = _StringTable(u32(_ALLERGY_KEY_OFFSETS), sections[_ALLERGY_KEY_BLOB])
+        self._allergy_row_offsets = u32(_ALLERGY_ROW_OFFSETS)
+        self._allergy_rows = u32(_ALLERGY_ROWS)
+        self.medicines = _CompiledMedicines(self)
+        self._name_resolver = None
+        self._fallbacks_logged: set = set()
+
+    def to_document(self) -> Dict[str, Any]:
+        """The versioned file format, decoded back from the compiled tables"""
+        return {"version": self.version, "medicines": dict(self.medicines), "aliases": self.aliases}
+
+    def name_resolver(self) -> NameResolver:
+        """Typo-tolerant index over the medicine names and aliases, built on first use per process (ConflictChecker builds it before installing the snapshot)"""
+        resolver = self._name_resolver
+        if resolver is None:
+            resolver = self._name_resolver = NameResolver((self._drugs.text(drug_id) for drug_id in range(len(self._drugs))), self.aliases)
+        return resolver
+
+    def _medicine_id(self, medicine: str) -> int:
+        drug_id = self._drugs.find(medicine)
+        return drug_id if drug_id >= 0 and self._medicine_rank[drug_id] != NO_ENTRY else -1
+
+    def _optional_text(self, string_id: int) -> Optional[str]:
+        return None if string_id == NO_ENTRY else self._strings.text(string_id)
+
+    def _decode_medicine(self, drug_id: int) -> MedicineEntry:
+        declared, allergy_decl = self._declared, self._allergy_decl
+        conflicts = tuple(ConflictEntry(self._drugs.text(declared[2 * index]), self._strings.text(declared[2 * index + 1]))
+                          for index in range(self._declared_offsets[drug_id], self._declared_offsets[drug_id + 1]))
+        allergy_conflicts = tuple(AllergyEntry(self._optional_text(allergy_decl[2 * index]), self._optional_text(allergy_decl[2 * index + 1]))
+                                  for index in range(self._allergy_decl_offsets[drug_id], self._allergy_decl_offsets[drug_id + 1]))
+        return MedicineEntry(conflicts, allergy_conflicts)
+
+    def _edge_reason(self, drug_id: int, neighbor_id: int) -> Optional[int]:
+        """Reason id drug_id declared for the pair, NO_ENTRY if only the neighbor did, None if no interaction"""
+        lo, hi = self._neighbor_offsets[drug_id], self._neighbor_offsets[drug_id + 1]
+        index = bisect_left(self._neighbors, neighbor_id, lo, hi)
+        if index < hi and self._neighbors[index] == neighbor_id:
+            return self._neighbor_reasons[index]
+        return None
+
+    def _interaction(self, med1: str, id1: int, med2: str, id2: int) -> Optional[Interaction]:
+        reason_id = self._edge_reason(id1, id2)
+        if reason_id is None:
+            return None
+        if reason_id != NO_ENTRY:
+            return Interaction(f"{med1} + {med2}", self._strings.text(reason_id))
+        return Interaction(f"{med2} + {med1}", self._strings.text(self._edge_reason(id2, id1)))
+
+    def pair_interaction(self, med1: str, med2: str) -> Optional[Interaction]:
+        """Interaction entry for an ordered pair of medicines, or None if they don't interact"""
+        id1, id2 = self._drugs.find(med1), self._drugs.find(med2)
+        if id1 < 0 or id2 < 0:
+            return None
+        return self._interaction(med1, id1, med2, id2)
+
+    def find_interactions(self, medicines: List[str], engine: str) -> List[Interaction]:
+        """Interaction lookup; "pairwise" scans every pair, every other engine walks the pair table"""
+        if engine == "pairwise":
+            return self.find_interactions_pairwise(medicines)
+        if engine != "adjacency":
+            self._log_fallback(engine)
+        return self.find_interactions_adjacency(medicines)
+
+    def _log_fallback(self, engine: str):
+        """Say once per snapshot that an engine without a compiled index is served by walking the pair table"""
+        if engine in self._fallbacks_logged:
+            return
+        if engine not in ("bitset", "numpy"):
+            raise ValueError(f"Unknown interaction engine: {engine}")
+        self._fallbacks_logged.add(engine)
+        logger.info("Compiled knowledge base %s has no %s index; serving %s lookups with the adjacency engine",
+                       self.path, engine, engine)
+
+    def find_interactions_pairwise(self, medicines: List[str]) -> List[Interaction]:
+        """Find all drug-drug interactions among the medicines"""
+        ids = [self._drugs.find(medicine) for medicine in medicines]
+        interactions = []
+        pairs = []
+        for i, med1 in enumerate(medicines):
+            if ids[i] < 0:
+                continue
+            for j in range(i + 1, len(medicines)):
+                if ids[j] >= 0:
+                    interaction = self._interaction(med1, ids[i], medicines[j], ids[j])
+                    if interaction:
+                        interactions.append(interaction)
+                        pairs.append((i, j))
+        return _as_scanned(medicines, pairs, interactions)
+
+    def find_interactions_adjacency(self, medicines: List[str]) -> List[Interaction]:
+        """Walk each medicine's row of the pair table; output matches find_interactions_pairwise"""
+        ids = [self._drugs.find(medicine) for medicine in medicines]
+        positions: Dict[int, List[int]] = {}
+        for index, drug_id in enumerate(ids):
+            if drug_id >= 0:
+                positions.setdefault(drug_id, []).append(index)
+
+        neighbor_offsets, neighbors = self._neighbor_offsets, self._neighbors
+        pairs = []
+        for i, drug_id in enumerate(ids):
+            if drug_id < 0:
+                continue
+            for neighbor_id in neighbors[neighbor_offsets[drug_id]:neighbor_offsets[drug_id + 1]]:
+                for j in positions.get(neighbor_id, ()):
+                    if j > i:
+                        pairs.append((i, j))
+
+        # Report in the same order the pairwise scan would
+        pairs.sort()
+        return _as_scanned(medicines, pairs, [self._interaction(medicines[i], ids[i], medicines[j], ids[j]) for i, j in pairs])
+
+    def find_interactions_numpy_batch(self, medicine_lists: List[List[str]], max_rows: int = 4096) -> List[List[Interaction]]:
+        """Batch lookup; the compiled tables are walked per prescription"""
+        self._log_fallback("numpy")
+        return [self.find_interactions_adjacency(medicines) for medicines in medicine_lists]
+
+    def match_user_allergies(self, medicines: List[str], allergies: Iterable[str]) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Probe the sorted allergy table - EXACT MATCH ONLY, no partial matching
+
+        Returns:
+            (medicine, normalized allergy, dataset reason) tuples in prescription order,
+            then in the dataset's order for each medicine
+        """
+        positions: Dict[str, List[Tuple[int, str]]] = {}
+        for index, medicine in enumerate(medicines):
+            positions.setdefault(medicine.lower().strip(), []).append((index, medicine))
+
+        rows = self._allergy_rows
+        matches = []
+        for allergy in allergies:
+            key = self._allergy_keys.find(allergy)
+            if key < 0:
+                continue
+            for row in range(self._allergy_row_offsets[key], self._allergy_row_offsets[key + 1]):
+                indexed_medicine = self._drugs.text(rows[3 * row])
+                for index, medicine in positions.get(indexed_medicine, ()):
+                    matches.append((index, rows[3 * row + 1], medicine, allergy, self._optional_text(rows[3 * row + 2])))
+
+        matches.sort(key=lambda match: (match[0], match[1]))
+        return [(medicine, allergy, reason) for _, _, medicine, allergy, reason in matches]
+
+
+if __name__ == "__main__":
+    # Compile a data file: python knowledge_base.py data/conflict_database.json data/conflict_database.spkb
+    if len(sys.argv) != 3:
+        sys.exit("usage: python knowledge_base.py SOURCE.json OUTPUT.spkb")
+    source = load_knowledge_base(sys.argv[1])
+    compile_knowledge_base(source, sys.argv[2])
+    print(f"✅ Compiled {len(source.medicines)} medicines (version {source.version}) to {sys.argv[2]}")
@@ -0,0 +1,83 @@
+"""
+Logging configuration for Prescription Conflict Checker
+Log records are handed to a background thread through a bounded queue,
+so request threads never wait on stdout/file I/O
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Optional, TextIO
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+LOG_LEVEL_ENV = "SPARD_LOG_LEVEL"
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def setup_logging(level: Optional[str] = None, stream: Optional[TextIO] = None,
+                  queue_size: int = DEFAULT_QUEUE_SIZE) -> logging.handlers.QueueListener:
+    """
+    Route the root logger through a queue-backed handler
+
+    Args:
+        level: Log level name; defaults to $SPARD_LOG_LEVEL or INFO
+        stream: Destination for formatted records; defaults to stdout
+        queue_size: Maximum number of records buffered before new ones are dropped
+
+    Returns:
+        The running QueueListener (stopped automatically at exit)
+    """
+    global _listener, _queue_handler
+
+    level = (level or os.environ.get(LOG_LEVEL_ENV, "INFO")).upper()
+    root = logging.getLogger()
+    root.setLevel(level)
+
+    if _listener is not None:
+        return _listener
+
+    output_handler = logging.StreamHandler(stream or sys.stdout)
+    output_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background listener"""
+    global _listener, _queue_handler
+
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
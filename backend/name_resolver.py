@@ -0,0 +1,220 @@
+"""
+Medicine name resolution for Prescription Conflict Checker
+Maps what a user or OCR typed (brand names, synonyms, typos, dose suffixes) to
+the medicine names the knowledge base knows
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import LRUCache
+from records import NameResolution
+
+# Strength/dose tokens dropped before matching, e.g. "ibuprofen 400 mg"
+_DOSE = re.compile(r"\b\d+(?:\.\d+)?\s*(?:mg|mcg|g|ml|iu|units?|%)(?=\W|$)")
+_SEPARATORS = re.compile(r"[\s_\-]+")
+_PADDING = "$"
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, drop dose tokens and treat spaces, underscores and hyphens alike"""
+    name = _DOSE.sub(" ", name.lower())
+    return _SEPARATORS.sub(" ", name).strip()
+
+
+def _bigrams(name: str) -> List[str]:
+    """Padded bigrams in position order, letters sorted so an adjacent swap inside one keeps it"""
+    padded = f"{_PADDING}{name}{_PADDING}"
+    return [a + b if a <= b else b + a for a, b in zip(padded, padded[1:])]
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent transpositions count as one edit), or limit + 1 if above limit"""
+    # A shared prefix or suffix never costs an edit
+    start, end_a, end_b = 0, len(a), len(b)
+    while start < end_a and start < end_b and a[start] == b[start]:
+        start += 1
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a or not b:
+        return max(len(a), len(b))
+
+    # Only cells within `limit` of the diagonal can stay within the limit
+    over = limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            distance = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < distance:
+                distance = previous[j] + 1
+            if current[j - 1] + 1 < distance:
+                distance = current[j - 1] + 1
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == b[j - 1] and previous2[j - 2] + 1 < distance:
+                distance = previous2[j - 2] + 1
+            current[j] = distance
+            if distance < row_min:
+                row_min = distance
+        if row_min > limit:
+            return over
+        previous2, previous = previous, current
+    return min(previous[-1], over)
+
+
+def _within_misses(masks: Iterable[int], candidates: int, misses: int) -> int:
+    """Bits of candidates set in every mask but at most `misses` of them"""
+    # at_most[m]: candidates missing from at most m of the masks seen so far
+    at_most = [candidates] * (misses + 1)
+    for mask in masks:
+        for m in range(misses, 0, -1):
+            at_most[m] = (at_most[m] & mask) | at_most[m - 1]
+        at_most[0] &= mask
+        if not at_most[misses]:
+            break
+    return at_most[misses]
+
+
+class NameResolver:
+    """
+    Resolve free-text medicine names against known names and aliases
+
+    Exact and alias hits are one dict probe. Misses are matched against names of the
+    lengths the typo budget allows, as bitmasks over each length's names (bit i =
+    i-th name) keyed by (name length, position, letter or bigram). Each edit removes
+    at most one of the query's letters and two of its bigrams, and moves the rest at
+    most k positions, so a name within k edits has all but k letters and all but 2k
+    bigrams within k positions, seen from either string. Those four count filters
+    run as big-int AND/OR over every name at once; the few survivors are verified
+    with a bounded edit distance. Results are memoized.
+    """
+
+    def __init__(self, names: Iterable[str], aliases: Optional[Dict[str, str]] = None, cache_size: int = 8192):
+        """
+        Args:
+            names: Canonical medicine names
+            aliases: Brand name or synonym -> canonical name
+            cache_size: Resolutions memoized (LRU); 0 disables memoization
+        """
+        # Normalized spelling -> (canonical name, "name" or "alias"); names win over aliases
+        self._exact: Dict[str, Tuple[str, str]] = {}
+        for alias, medicine in (aliases or {}).items():
+            self._exact[normalize_name(alias)] = (medicine, "alias")
+        for medicine in names:
+            self._exact[normalize_name(medicine)] = (medicine, "name")
+
+        # Name length -> spellings of that length; a spelling's index is its bit
+        self._by_length: Dict[int, List[str]] = {}
+        for key in self._exact:
+            self._by_length.setdefault(len(key), []).append(key)
+
+        # (length, position, letter or bigram) -> bitmask of the spellings that have it there.
+        # Bits are set in a byte buffer and converted once, rather than OR-ing growing ints.
+        self._masks: Dict[Tuple[int, int, str], int] = {}
+        for length, keys in self._by_length.items():
+            buffers: Dict[Tuple[int, str], bytearray] = {}
+            for bit, key in enumerate(keys):
+                for grams in (key, _bigrams(key)):
+                    for position, gram in enumerate(grams):
+                        buffer = buffers.get((position, gram))
+                        if buffer is None:
+                            buffer = buffers[(position, gram)] = bytearray((len(keys) + 7) // 8)
+                        buffer[bit >> 3] |= 1 << (bit & 7)
+            for (position, gram), buffer in buffers.items():
+                self._masks[(length, position, gram)] = int.from_bytes(buffer, "little")
+
+        self._cache = LRUCache(max_entries=cache_size)
+
+    @staticmethod
+    def max_edits(length: int) -> int:
+        """Typo budget for a name of this length"""
+        if length < 4:
+            return 0
+        return 1 if length < 8 else 2
+
+    def resolve(self, name: str) -> NameResolution:
+        """
+        Resolve one name
+
+        Returns:
+            NameResolution with match "name" (already canonical), "normalized" (canonical
+            after normalization), "alias", "fuzzy" (with the edit distance) or "unknown".
+            A fuzzy match is only the closest known spelling, possibly a different drug
+            (lansoprazole / pantoprazole): offer it, don't substitute it
+        """
+        resolution = self._cache.get(name)
+        if resolution is None:
+            resolution = self._resolve(name)
+            self._cache.set(name, resolution)
+        return resolution
+
+    def _resolve(self, name: str) -> NameResolution:
+        normalized = normalize_name(name)
+        hit = self._exact.get(normalized)
+        if hit is not None:
+            medicine, kind = hit
+            if kind == "name":
+                kind = "name" if medicine == name else "normalized"
+            return NameResolution(name, medicine, kind)
+
+        match = self._closest(normalized)
+        if match is None:
+            return NameResolution(name, None, "unknown")
+        key, distance = match
+        return NameResolution(name, self._exact[key][0], "fuzzy", distance)
+
+    def _closest(self, query: str) -> Optional[Tuple[str, int]]:
+        """(closest key, edit distance) within the typo budget, or None"""
+        limit = self.max_edits(len(query))
+        if limit == 0:
+            return None
+        bigrams = _bigrams(query)
+
+        best = None
+        for length in range(max(1, len(query) - limit), len(query) + limit + 1):
+            keys = self._by_length.get(length)
+            if not keys:
+                continue
+            candidates = (1 << len(keys)) - 1
+            for grams, misses, key_positions in ((query, limit, length), (bigrams, 2 * limit, length + 1)):
+                candidates = _within_misses(self._query_side(length, grams, limit), candidates, misses)
+                if candidates:
+                    candidates = _within_misses(self._key_side(length, key_positions, grams, limit), candidates, misses)
+                if not candidates:
+                    break
+
+            while candidates:
+                low = candidates & -candidates
+                candidates ^= low
+                key = keys[low.bit_length() - 1]
+                distance = _edit_distance(query, key, limit)
+                if distance <= limit and (best is None or (distance, key) < best):
+                    best = (distance, key)
+
+        return None if best is None else (best[1], best[0])
+
+    def _query_side(self, length: int, grams: List[str], limit: int) -> Iterable[int]:
+        """Per query gram: names of this length with the same gram within `limit` positions"""
+        masks = self._masks
+        for position, gram in enumerate(grams):
+            mask = 0
+            for shifted in range(max(0, position - limit), position + limit + 1):
+                mask |= masks.get((length, shifted, gram), 0)
+            yield mask
+
+    def _key_side(self, length: int, key_positions: int, grams: List[str], limit: int) -> Iterable[int]:
+        """Per name position: names of this length whose gram there is a query gram within `limit` positions"""
+        masks = self._masks
+        for position in range(key_positions):
+            mask = 0
+            for gram in set(grams[max(0, position - limit):position + limit + 1]):
+                mask |= masks.get((length, position, gram), 0)
+            yield mask
@@ -0,0 +1,139 @@
+"""
+Compact records for Prescription Conflict Checker
+Knowledge base entries and analysis results are __slots__ objects that share their
+strings; they become JSON objects only when a response or history row is serialized
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+# Records are immutable, so their own __init__ writes fields through object.__setattr__
+_set = object.__setattr__
+
+
+class Record:
+    """
+    Base for immutable slotted records
+    Fields also read like dict keys (record["reason"]) so code written against the
+    old dict entries keeps working; to_dict()/json_default produce the JSON shape.
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and other._values() == self._values()
+
+    def __hash__(self) -> int:
+        return hash(self._values())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+    def __reduce__(self):
+        return (type(self), self._values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON object form; fields that are None are omitted"""
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+
+class ConflictEntry(Record):
+    """One entry of a medicine's "conflicts" list"""
+    __slots__ = ("drug", "reason")
+
+    def __init__(self, drug: str, reason: str):
+        _set(self, "drug", drug)
+        _set(self, "reason", reason)
+
+
+class AllergyEntry(Record):
+    """One entry of a medicine's "allergy_conflicts" list"""
+    __slots__ = ("allergy", "reason")
+
+    def __init__(self, allergy: Optional[str], reason: Optional[str]):
+        _set(self, "allergy", allergy)
+        _set(self, "reason", reason)
+
+
+class MedicineEntry(Record):
+    """A medicine's knowledge base entry"""
+    __slots__ = ("conflicts", "allergy_conflicts")
+
+    def __init__(self, conflicts: Tuple[ConflictEntry, ...], allergy_conflicts: Tuple[AllergyEntry, ...]):
+        _set(self, "conflicts", conflicts)
+        _set(self, "allergy_conflicts", allergy_conflicts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"conflicts": [conflict.to_dict() for conflict in self.conflicts],
+                "allergy_conflicts": [allergy_info.to_dict() for allergy_info in self.allergy_conflicts]}
+
+
+class Interaction(Record):
+    """A drug-drug interaction reported in an analysis ("a + b", reason)"""
+    __slots__ = ("pair", "reason")
+
+    def __init__(self, pair: str, reason: str):
+        _set(self, "pair", pair)
+        _set(self, "reason", reason)
+
+
+class AllergyConflict(Record):
+    """A prescribed medicine matching one of the user's allergies"""
+    __slots__ = ("medicine", "allergy", "reason", "type")
+
+    def __init__(self, medicine: str, allergy: str, reason: str, type: str = "user_allergy_dataset_match"):
+        _set(self, "medicine", medicine)
+        _set(self, "allergy", allergy)
+        _set(self, "reason", reason)
+        _set(self, "type", type)
+
+
+class NameResolution(Record):
+    """How one submitted medicine name was matched to a known medicine (for "fuzzy", only suggested)"""
+    __slots__ = ("input", "medicine", "match", "distance")
+
+    def __init__(self, input: str, medicine: Optional[str], match: str, distance: Optional[int] = None):
+        _set(self, "input", input)
+        _set(self, "medicine", medicine)
+        _set(self, "match", match)
+        _set(self, "distance", distance)
+
+
+def medicine_entry(medicine_data: Any, reasons: Dict[str, str]) -> MedicineEntry:
+    """
+    Build a MedicineEntry from a {"conflicts": [...], "allergy_conflicts": [...]} dict
+
+    Only "drug", "allergy" and "reason" are kept. Reason strings are interned through
+    reasons (a str -> str pool) so repeated reasons share one object.
+    """
+    if isinstance(medicine_data, MedicineEntry):
+        return medicine_data
+
+    def pooled(value):
+        return reasons.setdefault(value, value) if isinstance(value, str) else value
+
+    return MedicineEntry(
+        tuple(ConflictEntry(conflict["drug"], pooled(conflict["reason"])) for conflict in medicine_data.get("conflicts", [])),
+        tuple(AllergyEntry(allergy_info.get("allergy"), pooled(allergy_info.get("reason")))
+              for allergy_info in medicine_data.get("allergy_conflicts", []))
+    )
+
+
+def json_default(value: Any) -> Any:
+    """json.dumps default= hook: serialize records as JSON objects"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
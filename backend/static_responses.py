@@ -0,0 +1,140 @@
+"""
+Pre-serialized responses for Prescription Conflict Checker
+/medicines and /conflicts/<medicine> only change with the knowledge base, so their
+bodies are serialized and gzip-compressed once per knowledge base version and served
+with strong ETags; conditional requests get 304 without touching the data
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from cache import LRUCache
+from records import json_default
+
+# Clients may reuse a body this long, then revalidate with If-None-Match
+CACHE_CONTROL = "public, max-age=60"
+
+# Bodies smaller than this are not worth a gzip round trip
+MIN_GZIP_BYTES = 512
+
+
+def dump_json(payload: Any) -> bytes:
+    """Encode payload the way Flask's jsonify does outside debug mode"""
+    return (json.dumps(payload, default=json_default, sort_keys=True, separators=(",", ":")) + "\n").encode()
+
+
+class PrecomputedResponse:
+    """An encoded JSON body, its gzip variant and their strong ETags"""
+    __slots__ = ("body", "gzip_body", "etag", "gzip_etag")
+
+    def __init__(self, payload: Any):
+        self.body = dump_json(payload)
+        # Content hash, not the knowledge base version: equal across worker processes
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+
+        compressed = gzip.compress(self.body, compresslevel=9, mtime=0) if len(self.body) >= MIN_GZIP_BYTES else None
+        if compressed is not None and len(compressed) < len(self.body):
+            self.gzip_body = compressed
+            self.gzip_etag = f'"{digest}-gzip"'
+        else:
+            self.gzip_body = None
+            self.gzip_etag = None
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """If-None-Match check (weak comparison, as RFC 9110 prescribes for it)"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return self.etag in tags or (self.gzip_etag is not None and self.gzip_etag in tags)
+
+    def for_request(self, if_none_match: Optional[str], accept_encoding: Optional[str]) -> Tuple[int, Dict[str, str], bytes]:
+        """(status, headers, body) answering a GET with these request headers"""
+        use_gzip = self.gzip_body is not None and accepts_gzip(accept_encoding)
+        headers = {
+            "ETag": self.gzip_etag if use_gzip else self.etag,
+            "Cache-Control": CACHE_CONTROL,
+            "Vary": "Accept-Encoding"
+        }
+        if self.matches(if_none_match):
+            return 304, headers, b""
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return 200, headers, self.gzip_body
+        return 200, headers, self.body
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """True if an Accept-Encoding header allows gzip"""
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = params.strip().lower()
+            if not quality.startswith("q="):
+                return True
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+class StaticResponses:
+    """
+    Precomputed /medicines and /conflicts/<medicine> bodies for the installed knowledge base
+    Entries are built on first request and dropped as soon as the checker's
+    database_version changes (reload, import_database, add_medicine_to_database).
+    """
+
+    def __init__(self, checker, max_entries: int = 4096):
+        """
+        Args:
+            checker: ConflictChecker whose knowledge base is served
+            max_entries: Bodies kept (LRU)
+        """
+        self.checker = checker
+        self._cache = LRUCache(max_entries=max_entries)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _get(self, kb, key: Hashable, build: Callable[[], Any]) -> PrecomputedResponse:
+        """Cached body for key, built from kb (the snapshot build reads) and filed under kb's generation"""
+        version = kb.generation
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._cache.clear()
+                    self._version = version
+
+        cached = self._cache.get((version, key))
+        if cached is None:
+            cached = PrecomputedResponse(build())
+            self._cache.set((version, key), cached)
+        return cached
+
+    def medicines(self) -> PrecomputedResponse:
+        """GET /medicines"""
+        kb = self.checker.knowledge_base
+
+        def build():
+            medicines = list(kb.medicines.keys())
+            return {"medicines": medicines, "count": len(medicines)}
+        return self._get(kb, None, build)
+
+    def medicine_conflicts(self, medicine: str) -> Optional[PrecomputedResponse]:
+        """GET /conflicts/<medicine> (medicine already lowercased), or None if it is unknown"""
+        # Lookup and cache key come from one snapshot, so a concurrent reload can't
+        # file the old entry under the new version
+        kb = self.checker.knowledge_base
+        conflicts = kb.medicines.get(medicine)
+        if conflicts is None:
+            return None
+        return self._get(kb, medicine, lambda: {"medicine": medicine, "conflicts": conflicts})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self._version, **self._cache.stats()}
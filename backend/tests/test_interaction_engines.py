@@ -0,0 +1,65 @@
+"""
+Every interaction engine against a fixed copy of what the original pairwise
+_find_drug_interactions returned (tests/data/baseline_interactions.json)
+"""
+
+import json
+import os
+
+import pytest
+
+from conflict_checker import ConflictChecker
+from knowledge_base import DEFAULT_KNOWLEDGE_BASE_PATH, compile_knowledge_base, load_knowledge_base, np
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "baseline_interactions.json"), encoding="utf-8") as f:
+    BASELINE = json.load(f)
+
+ENGINES = [engine for engine in ConflictChecker.INTERACTION_ENGINES if engine != "numpy" or np is not None]
+CASES = [pytest.param(case["medicines"], case["interactions"], id=case["name"]) for case in BASELINE["cases"]]
+
+
+def as_dicts(interactions):
+    return [interaction.to_dict() for interaction in interactions]
+
+
+@pytest.fixture(scope="module")
+def kb():
+    return load_knowledge_base(DEFAULT_KNOWLEDGE_BASE_PATH)
+
+
+@pytest.fixture(scope="module")
+def compiled_kb(kb, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("kb") / "conflict_database.spkb")
+    compile_knowledge_base(kb, path)
+    return load_knowledge_base(path)
+
+
+@pytest.fixture(scope="module")
+def checker():
+    return ConflictChecker(result_cache_size=0)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("medicines, expected", CASES)
+def test_engine_matches_baseline(kb, engine, medicines, expected):
+    assert as_dicts(kb.find_interactions(medicines, engine)) == expected
+
+
+@pytest.mark.parametrize("engine", ["pairwise", "adjacency"])
+@pytest.mark.parametrize("medicines, expected", CASES)
+def test_compiled_engine_matches_baseline(compiled_kb, engine, medicines, expected):
+    assert as_dicts(compiled_kb.find_interactions(medicines, engine)) == expected
+
+
+@pytest.mark.skipif(np is None, reason="the numpy engine needs NumPy")
+def test_numpy_batch_matches_baseline(kb):
+    cases = BASELINE["cases"]
+    found = kb.find_interactions_numpy_batch([case["medicines"] for case in cases])
+    assert [as_dicts(interactions) for interactions in found] == [case["interactions"] for case in cases]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("case", BASELINE["alias_cases"], ids=[case["name"] for case in BASELINE["alias_cases"]])
+def test_aliases_resolve_before_lookup(checker, engine, case):
+    result = checker.analyze_prescriptions(case["doctorA_medicines"], case["doctorB_medicines"], engine=engine)
+    assert as_dicts(result["interactions"]) == case["interactions"]